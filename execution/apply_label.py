@@ -8,6 +8,7 @@ Last Updated: 2025-12-11
 import os
 from dotenv import load_dotenv
 from utils import setup_logging
+from gmail_auth import execute_request
 
 # Load environment variables
 load_dotenv()
@@ -15,6 +16,14 @@ load_dotenv()
 # Setup logging
 logger = setup_logging("apply_label")
 
+# Partial-response field masks: only request what the pipeline reads
+LABEL_LIST_FIELDS = 'labels(id,name)'
+LABEL_FIELDS = 'id'
+MODIFY_FIELDS = 'id'
+
+# messages.batchModify accepts at most this many IDs per call
+BATCH_MODIFY_LIMIT = 1000
+
 
 def get_or_create_label(service, label_name):
     """
@@ -29,7 +38,7 @@ def get_or_create_label(service, label_name):
     """
     try:
         # List all labels
-        results = service.users().labels().list(userId='me').execute()
+        results = execute_request(service.users().labels().list(userId='me', fields=LABEL_LIST_FIELDS))
         labels = results.get('labels', [])
         
         # Check if label already exists
@@ -46,10 +55,11 @@ def get_or_create_label(service, label_name):
             'messageListVisibility': 'show'
         }
         
-        created_label = service.users().labels().create(
+        created_label = execute_request(service.users().labels().create(
             userId='me',
-            body=label_object
-        ).execute()
+            body=label_object,
+            fields=LABEL_FIELDS
+        ))
         
         logger.info(f"✅ Created label '{label_name}' with ID: {created_label['id']}")
         return created_label['id']
@@ -72,11 +82,12 @@ def apply_label_to_email(service, email_id, label_id):
         Boolean: True if successful, False otherwise
     """
     try:
-        service.users().messages().modify(
+        execute_request(service.users().messages().modify(
             userId='me',
             id=email_id,
-            body={'addLabelIds': [label_id]}
-        ).execute()
+            body={'addLabelIds': [label_id]},
+            fields=MODIFY_FIELDS
+        ))
         
         logger.info(f"✅ Applied label to email {email_id}")
         return True
@@ -99,11 +110,12 @@ def remove_label_from_email(service, email_id, label_id):
         Boolean: True if successful, False otherwise
     """
     try:
-        service.users().messages().modify(
+        execute_request(service.users().messages().modify(
             userId='me',
             id=email_id,
-            body={'removeLabelIds': [label_id]}
-        ).execute()
+            body={'removeLabelIds': [label_id]},
+            fields=MODIFY_FIELDS
+        ))
         
         logger.info(f"Removed label from email {email_id}")
         return True
@@ -113,6 +125,44 @@ def remove_label_from_email(service, email_id, label_id):
         return False
 
 
+def batch_modify_labels(service, email_ids, add_label_ids=None, remove_label_ids=None):
+    """
+    Add and/or remove labels on many emails with messages.batchModify.
+    
+    One API call covers up to BATCH_MODIFY_LIMIT emails, instead of one
+    modify call per email.
+    
+    Args:
+        service: Authenticated Gmail API service
+        email_ids: Email message IDs
+        add_label_ids: Label IDs to apply
+        remove_label_ids: Label IDs to remove
+        
+    Returns:
+        Number of emails successfully modified
+    """
+    modified = 0
+    
+    for start in range(0, len(email_ids), BATCH_MODIFY_LIMIT):
+        chunk = email_ids[start:start + BATCH_MODIFY_LIMIT]
+        try:
+            execute_request(service.users().messages().batchModify(
+                userId='me',
+                body={
+                    'ids': chunk,
+                    'addLabelIds': add_label_ids or [],
+                    'removeLabelIds': remove_label_ids or []
+                }
+            ))
+            modified += len(chunk)
+            
+        except Exception as e:
+            logger.error(f"Error batch-modifying {len(chunk)} emails (starting at {chunk[0]}): {e}")
+    
+    logger.info(f"Batch-modified labels on {modified}/{len(email_ids)} emails")
+    return modified
+
+
 def list_user_labels(service):
     """
     List all labels for the user (debugging).
@@ -124,7 +174,7 @@ def list_user_labels(service):
         List of label dictionaries
     """
     try:
-        results = service.users().labels().list(userId='me').execute()
+        results = execute_request(service.users().labels().list(userId='me', fields=LABEL_LIST_FIELDS))
         labels = results.get('labels', [])
         
         logger.info(f"Found {len(labels)} labels")
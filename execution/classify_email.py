@@ -6,9 +6,15 @@ Last Updated: 2025-12-11
 """
 
 import os
+import re
+import time
 from groq import Groq
 from dotenv import load_dotenv
-from utils import setup_logging, retry_with_exponential_backoff
+from utils import setup_logging, RetryPolicy
+from tracing import span
+from sender_reputation import lookup_reputation, record_verdict
+from rule_engine import evaluate_rules, compile_keyword_pattern
+from local_model import predict_local, learn_local
 
 # Load environment variables
 load_dotenv()
@@ -16,8 +22,73 @@ load_dotenv()
 # Setup logging
 logger = setup_logging("classify_email")
 
-# Initialize Groq client
-groq_client = Groq(api_key=os.getenv('GROQ_API_KEY'))
+# Initialize Groq client (retries are handled by groq_retry, not the SDK)
+groq_client = Groq(api_key=os.getenv('GROQ_API_KEY'), max_retries=0)
+
+# Retry policy for Groq calls
+groq_retry = RetryPolicy(name="groq", max_attempts=3)
+
+# System prompts for the two model tiers
+LARGE_SYSTEM_PROMPT = "You are an email classifier. Respond with ONLY 'YES' or 'NO'."
+FAST_SYSTEM_PROMPT = (
+    "You are an email classifier. Respond with ONLY 'YES' or 'NO' followed by "
+    "your confidence from 0 to 100, for example 'YES 95' or 'NO 70'."
+)
+
+# ManageBac-related keyword weights used by fallback classification and the
+# cascade. Keywords match whole words only; negative weights mark promotional mail.
+KEYWORD_WEIGHTS = {
+    'managebac': 3.0,
+    'cas reflection': 2.5,
+    'extended essay': 2.5,
+    'theory of knowledge': 2.5,
+    'ib diploma': 2.5,
+    'ib dp': 2.5,
+    'ib myp': 2.5,
+    'assignment submitted': 2.0,
+    'grade posted': 2.0,
+    'teacher comment': 2.0,
+    'tok': 1.5,
+    'coursework': 1.5,
+    'due date': 1.0,
+    'academic': 0.5,
+    'unsubscribe': -1.0,
+    'newsletter': -1.0,
+    'discount': -1.0,
+    'your order': -1.5
+}
+
+# How much a keyword counts in each field (a subject hit says more than a body hit)
+FIELD_WEIGHTS = {
+    'subject': 1.5,
+    'sender': 2.0,
+    'body': 1.0
+}
+
+# Compiled once: every field is scanned in a single pass
+KEYWORD_PATTERN = compile_keyword_pattern(KEYWORD_WEIGHTS)
+
+# Per-tier cascade statistics for the current run
+cascade_stats = {}
+
+# Tiers whose verdicts are trusted enough to teach the reputation store and local model
+LEARNING_TIERS = {'keywords', 'fast_model', 'large_model'}
+
+
+def get_cascade_config():
+    """
+    Read the model cascade settings from the environment.
+    
+    Returns:
+        Dictionary with cascade settings
+    """
+    return {
+        'enabled': os.getenv('CASCADE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        'large_model': os.getenv('GROQ_MODEL', 'openai/gpt-oss-120b'),
+        'fast_model': os.getenv('GROQ_FAST_MODEL', 'llama-3.1-8b-instant'),
+        'keyword_min_score': float(os.getenv('CASCADE_KEYWORD_MIN_SCORE', 4.0)),
+        'fast_min_confidence': int(os.getenv('CASCADE_FAST_MIN_CONFIDENCE', 90))
+    }
 
 
 def classify_email(subject, sender, body):
@@ -32,49 +103,205 @@ def classify_email(subject, sender, body):
     Returns:
         Boolean: True if ManageBac-related, False otherwise
     """
+    return classify_email_detailed(subject, sender, body)['is_managebac']
+
+
+def classify_email_detailed(subject, sender, body, learn=True, use_learned=True):
+    """
+    Classify an email through the model cascade and report how it was decided.
+    
+    Tiers, cheapest first:
+    1. rule        - a configured rule (incl. built-in @managebac.com) matches
+    2. reputation  - sender or domain has a consistent verdict history
+    3. local_model - local naive Bayes model is confident
+    4. keywords    - weighted keyword score is high enough to be confident
+    5. fast_model  - small model answers with high enough confidence
+    6. large_model - GROQ_MODEL decides everything still uncertain
+    If the large model fails, keyword fallback classification is used.
+    
+    Args:
+        subject: Email subject line
+        sender: Email sender address
+        body: Email body content
+        learn: Teach this verdict to the reputation store and local model
+        use_learned: Consult the reputation and local model tiers
+        
+    Returns:
+        Dictionary with is_managebac, tier, confidence, model, tokens and duration
+    """
+    start = time.perf_counter()
+    config = get_cascade_config()
+    tokens = 0
+    
+    def decide(is_managebac, tier, confidence, model=None):
+        duration = time.perf_counter() - start
+        record_tier_hit(tier, duration, tokens)
+        if learn and tier in LEARNING_TIERS:
+            record_verdict(sender, is_managebac)
+            learn_local(subject, sender, body, is_managebac)
+        return {
+            'is_managebac': is_managebac,
+            'tier': tier,
+            'confidence': confidence,
+            'model': model,
+            'tokens': tokens,
+            'duration': duration
+        }
+    
     try:
-        # Quick check: If sender is from @managebac.com, it's definitely ManageBac
-        if '@managebac.com' in sender.lower():
-            logger.info(f"Auto-classified as ManageBac (sender: {sender})")
-            return True
+        # Quick check: deterministic rules (e.g. any @managebac.com sender)
+        rule_match = evaluate_rules(subject, sender, body)
+        if rule_match:
+            logger.info(
+                f"Auto-classified as {'ManageBac' if rule_match['is_managebac'] else 'not ManageBac'} "
+                f"(rule: {rule_match['rule']})"
+            )
+            return decide(rule_match['is_managebac'], 'rule', 1.0)
         
-        # Otherwise, use AI classification
-        prompt = build_classification_prompt(subject, sender, body)
+        # Known sender: consistent history decides without any API call
+        reputation = lookup_reputation(sender) if use_learned else None
+        resample = reputation is not None and reputation['resample']
+        if reputation and not resample:
+            logger.info(
+                f"Reputation decided {'YES' if reputation['is_managebac'] else 'NO'} "
+                f"({reputation['key']}: {reputation['count']:.1f} decayed emails, {reputation['agreement']:.0%} agreement)"
+            )
+            return decide(reputation['is_managebac'], 'reputation', reputation['agreement'])
         
-        # Use retry logic for API calls
-        def make_api_call():
-            response = groq_client.chat.completions.create(
-                model=os.getenv('GROQ_MODEL', 'openai/gpt-oss-120b'),
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an email classifier. Respond with ONLY 'YES' or 'NO'."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.1,  # Low temperature for consistent classification
-                max_tokens=10
+        # Local model: confident cases never reach Groq. Drift re-samples skip it,
+        # since it knows the sender too and would decide without learning anything
+        local = predict_local(subject, sender, body) if use_learned and not resample else None
+        if local:
+            logger.info(
+                f"Local model decided {'YES' if local['is_managebac'] else 'NO'} "
+                f"(p={local['probability']:.3f})"
             )
-            return response
+            return decide(local['is_managebac'], 'local_model', max(local['probability'], 1 - local['probability']))
+        
+        if config['enabled']:
+            # Tier: a high keyword score is a confident YES without any API call
+            score, matches = score_keywords(subject, sender, body)
+            if score >= config['keyword_min_score']:
+                logger.info(f"Cascade keywords decided YES (score {score:.1f}, matched: {', '.join(matches)})")
+                return decide(True, 'keywords', 1.0)
+            
+            # Tier: small fast model, accepted only above the confidence threshold
+            try:
+                fast_prompt = build_classification_prompt(subject, sender, body, with_confidence=True)
+                response = call_groq(config['fast_model'], FAST_SYSTEM_PROMPT, fast_prompt)
+                tokens += get_token_usage(response)
+                verdict, confidence = parse_confident_response(response)
+                
+                if verdict is not None and confidence >= config['fast_min_confidence']:
+                    logger.info(
+                        f"Cascade fast model decided {'YES' if verdict else 'NO'} "
+                        f"({confidence}%) for '{subject[:50]}...'"
+                    )
+                    return decide(verdict, 'fast_model', confidence / 100, config['fast_model'])
+                
+                logger.info(f"Fast model uncertain ({confidence}%), escalating to {config['large_model']}")
+            except Exception as e:
+                logger.warning(f"Fast model failed, escalating to {config['large_model']}: {e}")
         
-        response = retry_with_exponential_backoff(make_api_call, max_attempts=3)
+        # call_groq retries transient errors itself (see groq_retry)
+        prompt = build_classification_prompt(subject, sender, body)
+        response = call_groq(config['large_model'], LARGE_SYSTEM_PROMPT, prompt)
+        tokens += get_token_usage(response)
         
         # Parse response
         result = parse_ai_response(response)
         
         logger.info(f"Classification result for '{subject[:50]}...': {result}")
-        return result
+        return decide(result, 'large_model', None, config['large_model'])
         
     except Exception as e:
         logger.error(f"Error classifying email: {e}")
         # Fallback to keyword-based classification
-        return fallback_classification(subject, sender, body)
+        return decide(fallback_classification(subject, sender, body), 'fallback', None)
+
+
+@groq_retry
+def call_groq(model, system_prompt, prompt):
+    """
+    Send a classification request to Groq, retrying transient failures.
+    
+    Args:
+        model: Groq model name
+        system_prompt: System message describing the answer format
+        prompt: Classification prompt
+        
+    Returns:
+        Groq API response object
+    """
+    with span('groq.chat.completions', kind='client', model=model) as request_span:
+        response = groq_client.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.1,  # Low temperature for consistent classification
+            max_tokens=10
+        )
+        request_span.set_attribute('tokens', get_token_usage(response))
+        return response
+
+
+def get_token_usage(response):
+    """
+    Get the total token count of a Groq response.
+    
+    Args:
+        response: Groq API response object
+        
+    Returns:
+        Integer: Total tokens, 0 if usage is not reported
+    """
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', 0) or 0
 
 
-def build_classification_prompt(subject, sender, body):
+def record_tier_hit(tier, duration, tokens):
+    """
+    Record which cascade tier decided an email.
+    
+    Args:
+        tier: Name of the deciding tier
+        duration: Classification time in seconds
+        tokens: Groq tokens spent on the email
+    """
+    stats = cascade_stats.setdefault(tier, {'hits': 0, 'seconds': 0.0, 'tokens': 0})
+    stats['hits'] += 1
+    stats['seconds'] += duration
+    stats['tokens'] += tokens
+
+
+def get_cascade_report():
+    """
+    Summarize per-tier hit rates, latency and token usage for this run.
+    
+    Returns:
+        Dictionary mapping tier name to hits, hit_rate, avg_seconds and tokens
+    """
+    total = sum(stats['hits'] for stats in cascade_stats.values())
+    report = {}
+    for tier, stats in cascade_stats.items():
+        report[tier] = {
+            'hits': stats['hits'],
+            'hit_rate': stats['hits'] / total if total else 0.0,
+            'avg_seconds': stats['seconds'] / stats['hits'] if stats['hits'] else 0.0,
+            'tokens': stats['tokens']
+        }
+    return report
+
+
+def build_classification_prompt(subject, sender, body, with_confidence=False):
     """
     Build the classification prompt for the AI.
     
@@ -82,6 +309,7 @@ def build_classification_prompt(subject, sender, body):
         subject: Email subject
         sender: Email sender
         body: Email body (first 500 chars)
+        with_confidence: Ask for a 0-100 confidence after the verdict (fast model tier)
         
     Returns:
         Formatted prompt string
@@ -89,6 +317,11 @@ def build_classification_prompt(subject, sender, body):
     # Truncate body to first 500 characters
     body_preview = body[:500] if body else "No body content"
     
+    if with_confidence:
+        answer_format = 'Answer with ONLY "YES" or "NO" followed by your confidence from 0 to 100, for example "YES 95".'
+    else:
+        answer_format = 'Answer with ONLY "YES" or "NO".'
+    
     prompt = f"""You are classifying emails for a student using ManageBac (school management platform).
 
 IMPORTANT RULES:
@@ -108,7 +341,7 @@ Subject: {subject}
 Body: {body_preview}
 
 Question: Is this email related to ManageBac or school activities?
-Answer with ONLY "YES" or "NO"."""
+{answer_format}"""
 
     return prompt
 
@@ -140,9 +373,64 @@ def parse_ai_response(response):
         return False
 
 
+def parse_confident_response(response):
+    """
+    Parse a fast model response of the form 'YES 95' or 'NO 70'.
+    
+    Args:
+        response: Groq API response object
+        
+    Returns:
+        Tuple (verdict, confidence): verdict is True/False or None if unparseable,
+        confidence is 0-100 (0 when missing)
+    """
+    try:
+        content = response.choices[0].message.content.strip().upper()
+    except Exception as e:
+        logger.error(f"Error parsing fast model response: {e}")
+        return None, 0
+    
+    match = re.search(r'\b(YES|NO)\b\D*(\d{1,3})?', content)
+    if not match:
+        logger.warning(f"Unexpected fast model response: {content}")
+        return None, 0
+    
+    confidence = min(int(match.group(2)), 100) if match.group(2) else 0
+    return match.group(1) == 'YES', confidence
+
+
+def score_keywords(subject, sender, body):
+    """
+    Score an email by its weighted ManageBac keywords.
+    
+    Each field is scanned once with the precompiled pattern; a keyword counts
+    at most once per field, multiplied by that field's weight.
+    
+    Args:
+        subject: Email subject
+        sender: Email sender
+        body: Email body
+        
+    Returns:
+        Tuple (score, matched): total score and list of 'field:keyword' hits
+    """
+    score = 0.0
+    matched = []
+    
+    for field, text in (('subject', subject), ('sender', sender), ('body', body)):
+        if not text:
+            continue
+        keywords = {match.group(0).lower() for match in KEYWORD_PATTERN.finditer(text)}
+        for keyword in sorted(keywords & KEYWORD_WEIGHTS.keys()):
+            score += KEYWORD_WEIGHTS[keyword] * FIELD_WEIGHTS[field]
+            matched.append(f"{field}:{keyword}")
+    
+    return score, matched
+
+
 def fallback_classification(subject, sender, body):
     """
-    Fallback keyword-based classification if AI fails.
+    Fallback weighted keyword classification if AI fails.
     
     Args:
         subject: Email subject
@@ -154,33 +442,13 @@ def fallback_classification(subject, sender, body):
     """
     logger.info("Using fallback keyword-based classification")
     
-    # Combine all text
-    all_text = f"{subject} {sender} {body}".lower()
-    
-    # ManageBac-related keywords
-    keywords = [
-        'managebac',
-        '@managebac.com',
-        'cas reflection',
-        'tok',
-        'ib diploma',
-        'ib dp',
-        'ib myp',
-        'assignment submitted',
-        'grade posted',
-        'due date',
-        'coursework',
-        'academic',
-        'teacher comment'
-    ]
+    threshold = float(os.getenv('FALLBACK_SCORE_THRESHOLD', 2.0))
+    score, matches = score_keywords(subject, sender, body)
     
-    # Check if any keyword is present
-    for keyword in keywords:
-        if keyword in all_text:
-            logger.info(f"Matched keyword: {keyword}")
-            return True
+    if matches:
+        logger.info(f"Keyword score {score:.1f} (threshold {threshold}): {', '.join(matches)}")
     
-    return False
+    return score >= threshold
 
 
 if __name__ == "__main__":
@@ -207,10 +475,15 @@ if __name__ == "__main__":
     ]
     
     for i, email in enumerate(test_emails, 1):
-        result = classify_email(
+        result = classify_email_detailed(
             email['subject'],
             email['sender'],
             email['body']
         )
         print(f"\nTest {i}: {email['subject']}")
-        print(f"Result: {'✅ ManageBac' if result else '❌ Not ManageBac'}")
+        print(f"Result: {'✅ ManageBac' if result['is_managebac'] else '❌ Not ManageBac'} (tier: {result['tier']})")
+    
+    print("\nCascade report:")
+    for tier, stats in get_cascade_report().items():
+        print(f"  {tier}: {stats['hits']} hits ({stats['hit_rate']:.0%}), "
+              f"avg {stats['avg_seconds']:.2f}s, {stats['tokens']} tokens")
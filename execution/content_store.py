@@ -0,0 +1,190 @@
+"""
+Content Store Module
+Purpose: Caches parsed email content on disk so already-seen mail needs no Gmail traffic
+Author: AI Agent
+Last Updated: 2026-10-19
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from utils import setup_logging, ensure_directory_exists
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("content_store")
+
+# Open store, shared by every lookup in this process
+_store = None
+_store_lock = threading.Lock()
+
+
+class ContentStore:
+    """
+    SQLite store of parsed email content keyed by message ID.
+
+    Content (subject, sender, body, snippet) is stored as zlib-compressed
+    JSON. Entries older than max_age_days are dropped, and when the store
+    grows past max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, max_bytes, max_age_days):
+        ensure_directory_exists(os.path.dirname(path) or '.')
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'id TEXT PRIMARY KEY, '
+            'data BLOB NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'fetched_at REAL NOT NULL, '
+            'accessed_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_accessed ON messages (accessed_at)')
+        self.conn.commit()
+
+    def get(self, email_id):
+        """
+        Get cached content for a message.
+
+        Args:
+            email_id: Email message ID
+
+        Returns:
+            Content dictionary, or None if not cached or expired
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT data, fetched_at FROM messages WHERE id = ?', (email_id,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            if now - row[1] > self.max_age_seconds:
+                self.conn.execute('DELETE FROM messages WHERE id = ?', (email_id,))
+                self.conn.commit()
+                return None
+
+            self.conn.execute('UPDATE messages SET accessed_at = ? WHERE id = ?', (now, email_id))
+            self.conn.commit()
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, content):
+        """
+        Cache content for a message.
+
+        Args:
+            content: Content dictionary with at least an 'id' key
+        """
+        data = zlib.compress(json.dumps(content).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO messages (id, data, size, fetched_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (content['id'], data, len(data), now, now)
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """
+        Drop expired entries, then least recently used ones until under max_bytes.
+
+        Returns:
+            Number of entries removed
+        """
+        with self.lock:
+            removed = self.conn.execute(
+                'DELETE FROM messages WHERE fetched_at < ?', (time.time() - self.max_age_seconds,)
+            ).rowcount
+
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM messages').fetchone()[0]
+            if total > self.max_bytes:
+                # Walk entries oldest-access first and cut once enough is freed
+                excess = total - self.max_bytes
+                freed = 0
+                stale_ids = []
+                rows = self.conn.execute('SELECT id, size FROM messages ORDER BY accessed_at').fetchall()
+                for email_id, size in rows:
+                    if freed >= excess:
+                        break
+                    stale_ids.append((email_id,))
+                    freed += size
+                self.conn.executemany('DELETE FROM messages WHERE id = ?', stale_ids)
+                removed += len(stale_ids)
+
+            self.conn.commit()
+
+        if removed:
+            logger.info(f"Evicted {removed} cached messages")
+        return removed
+
+    def stats(self):
+        """
+        Get entry count and total compressed size.
+
+        Returns:
+            Dictionary with count and bytes
+        """
+        with self.lock:
+            count, size = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages'
+            ).fetchone()
+        return {'count': count, 'bytes': size}
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
+
+
+def get_content_store():
+    """
+    Open the process-wide content store (once per process).
+
+    Returns:
+        ContentStore instance, or None if CONTENT_STORE_ENABLED is false
+    """
+    global _store
+    if os.getenv('CONTENT_STORE_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = ContentStore(
+                    path=os.getenv('CONTENT_STORE_FILE', '.tmp/content_store.sqlite3'),
+                    max_bytes=int(float(os.getenv('CONTENT_STORE_MAX_MB', 100)) * 1024 * 1024),
+                    max_age_days=float(os.getenv('CONTENT_STORE_MAX_AGE_DAYS', 30))
+                )
+            except Exception as e:
+                logger.error(f"Error opening content store, continuing without cache: {e}")
+                return None
+
+    return _store
+
+
+if __name__ == "__main__":
+    print("Testing Content Store...")
+    print("-" * 50)
+
+    store = get_content_store()
+    if store:
+        removed = store.evict()
+        stats = store.stats()
+        print(f"Cached messages: {stats['count']} ({stats['bytes'] / 1024:.1f} KB compressed)")
+        print(f"Evicted: {removed}")
+    else:
+        print("Content store is disabled")
@@ -0,0 +1,157 @@
+"""
+Distributed Classifier
+Purpose: Producer/worker split so any number of processes can classify emails from a shared queue
+Author: AI Agent
+Last Updated: 2026-10-19
+
+Usage:
+    python execution/distributed_classifier.py produce                    # Queue unprocessed emails
+    python execution/distributed_classifier.py produce --query "label:inbox newer_than:90d" --max 5000
+    python execution/distributed_classifier.py work                       # Run a worker (start as many as needed)
+    python execution/distributed_classifier.py status                     # Queue counts by status
+"""
+
+import os
+import time
+import socket
+import argparse
+from datetime import datetime
+from dotenv import load_dotenv
+from gmail_auth import get_gmail_service
+from fetch_emails import fetch_unprocessed_emails, search_messages
+from apply_label import get_or_create_label
+from main_classifier import process_email
+from sender_reputation import save_reputation_store
+from local_model import save_local_model
+from results_sink import open_results_sink
+from work_queue import open_work_queue
+from tracing import span
+from utils import setup_logging, RUN_RETRY_BUDGET, get_retry_refill_rate
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("distributed_classifier")
+
+
+def produce(queue, service, query=None, max_results=500):
+    """
+    Enumerate candidate message IDs into the queue.
+
+    Args:
+        queue: WorkQueue instance
+        service: Authenticated Gmail API service
+        query: Gmail search query (default: the regular unprocessed-email query)
+        max_results: Maximum messages to enumerate
+
+    Returns:
+        Number of newly queued messages (already-queued IDs are skipped)
+    """
+    if query:
+        logger.info(f"Enumerating messages for query: {query}")
+        messages = search_messages(service, query, max_results)
+    else:
+        messages = fetch_unprocessed_emails(service, max_results=max_results)
+
+    added = queue.enqueue(messages)
+    logger.info(f"Queued {added} new messages ({len(messages) - added} already queued)")
+    return added
+
+
+def work(queue, service, batch_size=10, visibility_timeout=300, retry_delay=60,
+         idle_exit_seconds=60, max_items=None):
+    """
+    Lease and process queued emails until the queue stays empty.
+
+    Args:
+        queue: WorkQueue instance
+        service: Authenticated Gmail API service
+        batch_size: Items leased at once
+        visibility_timeout: Seconds a lease lasts before other workers may take the item
+        retry_delay: Seconds before a failed item is retried
+        idle_exit_seconds: Exit after the queue has been empty this long (0 = exit at once)
+        max_items: Stop after this many items (None = no limit)
+
+    Returns:
+        Run statistics dictionary
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    # A worker lives for many items: let spent retries come back over time
+    RUN_RETRY_BUDGET.set_refill(get_retry_refill_rate())
+    label_id = get_or_create_label(service, os.getenv('MANAGEBAC_LABEL_NAME', 'ManageBac'))
+    sink = open_results_sink(run_id=f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{worker_id}")
+    stats = {'total': 0, 'managebac': 0, 'not_managebac': 0, 'errors': 0}
+    idle_since = None
+
+    logger.info(f"Worker {worker_id} started")
+    try:
+        while max_items is None or stats['total'] < max_items:
+            items = queue.lease(worker_id, batch_size, visibility_timeout)
+            if not items:
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since >= idle_exit_seconds:
+                    break
+                time.sleep(min(5, idle_exit_seconds))
+                continue
+            idle_since = None
+
+            for item in items:
+                try:
+                    with span('process_email', email_id=item['id'], attempt=item['attempts']) as email_span:
+                        result = process_email(service, item, label_id, stats)
+                        result['trace_id'] = email_span.trace_id
+                    if sink:
+                        sink.write(result)
+                    error = result['error']
+                except Exception as e:
+                    logger.error(f"Error processing email {item['id']}: {e}")
+                    stats['errors'] += 1
+                    error = str(e)
+
+                stats['total'] += 1
+                if error:
+                    # Failed attempts go back to the queue until WORK_QUEUE_MAX_ATTEMPTS
+                    queue.nack(item['id'], item['lease_token'], error, retry_delay)
+                elif not queue.ack(item['id'], item['lease_token']):
+                    logger.warning(f"Lease on {item['id']} expired before ack; another worker may redo it")
+    finally:
+        if sink:
+            sink.close()
+        save_reputation_store()
+        save_local_model()
+
+    logger.info(
+        f"Worker {worker_id} finished: {stats['total']} processed, {stats['managebac']} labeled, "
+        f"{stats['not_managebac']} skipped, {stats['errors']} failed attempts"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed ManageBac email classifier")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    produce_parser = subparsers.add_parser('produce', help="Queue candidate message IDs")
+    produce_parser.add_argument('--query', help="Gmail search query (default: unprocessed primary inbox mail)")
+    produce_parser.add_argument('--max', type=int, default=500, help="Maximum messages to queue")
+
+    work_parser = subparsers.add_parser('work', help="Process queued messages")
+    work_parser.add_argument('--batch', type=int, default=10, help="Items leased at once")
+    work_parser.add_argument('--visibility-timeout', type=float, default=300, help="Lease length in seconds")
+    work_parser.add_argument('--retry-delay', type=float, default=60, help="Seconds before a failed item is retried")
+    work_parser.add_argument('--idle-exit', type=float, default=60, help="Exit after the queue is empty this long")
+    work_parser.add_argument('--max-items', type=int, help="Stop after this many items")
+
+    subparsers.add_parser('status', help="Show queue counts")
+
+    args = parser.parse_args()
+    queue = open_work_queue()
+
+    if args.command == 'produce':
+        produce(queue, get_gmail_service(), args.query, args.max)
+    elif args.command == 'work':
+        work(queue, get_gmail_service(), args.batch, args.visibility_timeout,
+             args.retry_delay, args.idle_exit, args.max_items)
+
+    print(f"Queue status: {queue.stats() or 'empty'}")
@@ -10,6 +10,8 @@ import base64
 from email.mime.text import MIMEText
 from dotenv import load_dotenv
 from utils import setup_logging
+from gmail_auth import execute_request
+from content_store import get_content_store
 
 # Load environment variables
 load_dotenv()
@@ -17,14 +19,22 @@ load_dotenv()
 # Setup logging
 logger = setup_logging("fetch_emails")
 
+# Partial-response field masks: only request what the pipeline reads.
+# Headers cannot be filtered by name, but labelIds, sizeEstimate,
+# internalDate, historyId, part headers and attachment stubs are dropped.
+LIST_FIELDS = 'messages(id,threadId),nextPageToken'
+MESSAGE_FIELDS = 'snippet,payload(headers(name,value),body/data,parts(mimeType,body/data))'
 
-def fetch_unprocessed_emails(service, max_results=50):
+
+def fetch_unprocessed_emails(service, max_results=50, exclude_ids=()):
     """
     Fetch emails that haven't been processed yet (don't have ManageBac label).
     
     Args:
         service: Authenticated Gmail API service
         max_results: Maximum number of emails to fetch
+        exclude_ids: IDs earlier runs already decided; skipped without counting
+                     toward max_results, so older undecided mail is still reached
         
     Returns:
         List of email message IDs and thread IDs
@@ -39,13 +49,7 @@ def fetch_unprocessed_emails(service, max_results=50):
         
         logger.info(f"Fetching emails with query: {query}")
         
-        results = service.users().messages().list(
-            userId='me',
-            q=query,
-            maxResults=max_results
-        ).execute()
-        
-        messages = results.get('messages', [])
+        messages = search_messages(service, query, max_results, exclude_ids)
         logger.info(f"Found {len(messages)} unprocessed emails")
         
         return messages
@@ -55,10 +59,47 @@ def fetch_unprocessed_emails(service, max_results=50):
         return []
 
 
+def search_messages(service, query, max_results=50, exclude_ids=()):
+    """
+    List message IDs matching a Gmail search query, following result pages.
+    
+    Args:
+        service: Authenticated Gmail API service
+        query: Gmail search query
+        max_results: Maximum number of messages to return
+        exclude_ids: IDs to leave out; paging continues past them
+        
+    Returns:
+        List of message dictionaries with 'id' and 'threadId', newest first
+    """
+    messages = []
+    page_token = None
+    
+    while len(messages) < max_results:
+        results = execute_request(service.users().messages().list(
+            userId='me',
+            q=query,
+            # Full pages when excluding: many listed IDs may be skipped
+            maxResults=500 if exclude_ids else min(max_results - len(messages), 500),  # Gmail page size limit
+            pageToken=page_token,
+            fields=LIST_FIELDS
+        ))
+        
+        messages.extend(m for m in results.get('messages', []) if m['id'] not in exclude_ids)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+    
+    return messages[:max_results]
+
+
 def get_email_content(service, email_id):
     """
     Extract email content including subject, sender, and body.
     
+    The local content store is consulted first; only uncached messages are
+    downloaded from Gmail, and those are added to the store.
+    
     Args:
         service: Authenticated Gmail API service
         email_id: Email message ID
@@ -66,12 +107,23 @@ def get_email_content(service, email_id):
     Returns:
         Dictionary with email details (subject, sender, body, snippet)
     """
+    store = get_content_store()
+    if store:
+        try:
+            cached = store.get(email_id)
+            if cached:
+                logger.info(f"Loaded email {email_id} from content store")
+                return cached
+        except Exception as e:
+            logger.warning(f"Content store read failed for {email_id}: {e}")
+    
     try:
-        message = service.users().messages().get(
+        message = execute_request(service.users().messages().get(
             userId='me',
             id=email_id,
-            format='full'
-        ).execute()
+            format='full',
+            fields=MESSAGE_FIELDS
+        ))
         
         headers = message['payload']['headers']
         
@@ -85,7 +137,7 @@ def get_email_content(service, email_id):
         # Get snippet (short preview)
         snippet = message.get('snippet', '')
         
-        return {
+        content = {
             'id': email_id,
             'subject': subject,
             'sender': sender,
@@ -93,6 +145,14 @@ def get_email_content(service, email_id):
             'snippet': snippet
         }
         
+        if store:
+            try:
+                store.put(content)
+            except Exception as e:
+                logger.warning(f"Content store write failed for {email_id}: {e}")
+        
+        return content
+        
     except Exception as e:
         logger.error(f"Error getting email content for {email_id}: {e}")
         return None
@@ -114,12 +174,13 @@ def parse_email_body(payload):
         # Check if payload has parts (multipart email)
         if 'parts' in payload:
             for part in payload['parts']:
+                # Field masks omit 'body' entirely when a part has no inline data
                 if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
+                    if 'data' in part.get('body', {}):
                         body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
                         break
                 elif part['mimeType'] == 'text/html' and not body:
-                    if 'data' in part['body']:
+                    if 'data' in part.get('body', {}):
                         body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
         else:
             # Single part email
@@ -6,6 +6,7 @@ Last Updated: 2025-12-11
 """
 
 import os
+import json
 import pickle
 from pathlib import Path
 from google.auth.transport.requests import Request
@@ -13,6 +14,8 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from dotenv import load_dotenv
+from utils import RetryPolicy
+from tracing import span
 
 # Load environment variables
 load_dotenv()
@@ -97,6 +100,9 @@ def get_gmail_service():
             print(f"✅ Credentials saved to {token_file}")
     
     try:
+        # googleapiclient's JSON model sends 'accept-encoding: gzip, deflate' and a
+        # '(gzip)' user-agent on every request, which Google requires before it
+        # compresses responses; don't override those headers on this service
         service = build('gmail', 'v1', credentials=creds)
         print("✅ Gmail authentication successful")
         return service
@@ -104,6 +110,30 @@ def get_gmail_service():
         raise Exception(f"Failed to build Gmail service: {e}")
 
 
+# Retry policy shared by all Gmail API calls
+gmail_retry = RetryPolicy(name="gmail", max_attempts=4)
+
+
+@gmail_retry
+def execute_request(request):
+    """
+    Execute a Gmail API request, retrying transient failures.
+    
+    Args:
+        request: googleapiclient HttpRequest (e.g. service.users().messages().get(...))
+        
+    Returns:
+        Parsed API response
+    """
+    # methodId already starts with 'gmail.' (e.g. gmail.users.messages.get)
+    with span(getattr(request, 'methodId', 'gmail.request'), kind='client') as request_span:
+        response = request.execute()
+        if request_span.recording:
+            # Size of the parsed response; only computed while tracing
+            request_span.set_attribute('response.bytes', len(json.dumps(response or {})))
+        return response
+
+
 def test_authentication():
     """Test Gmail authentication and print user email."""
     try:
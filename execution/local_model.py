@@ -0,0 +1,403 @@
+"""
+Local Model Module
+Purpose: Hashed n-gram naive Bayes pre-filter trained from the labeled mailbox
+Author: AI Agent
+Last Updated: 2026-10-19
+
+Usage:
+    python execution/local_model.py            # Show model status
+    python execution/local_model.py train      # Rebuild the model from Gmail
+"""
+
+import os
+import re
+import zlib
+import argparse
+import numpy as np
+from email.utils import parseaddr
+from dotenv import load_dotenv
+from utils import setup_logging, ensure_directory_exists, file_lock
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("local_model")
+
+# Tiers whose recorded verdicts are trusted as training labels
+TRAINING_TIERS = {'rule', 'keywords', 'fast_model', 'large_model'}
+
+# Hashed feature space size (2^18 buckets keeps collisions rare for email vocabularies)
+NUM_FEATURES = 2 ** 18
+
+# Token pattern for subject and body text
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Loaded model, shared by every prediction in this process
+_model = None
+
+# Counts as of the last load/save; save_local_model() merges only what was learned since
+_base_counts = None
+
+
+def extract_features(subject, sender, body):
+    """
+    Hash an email into feature bucket indices.
+
+    Features are word unigrams and bigrams per field (prefixed so 'tok' in
+    the subject and in the body are different features), plus the sender
+    address and domain. crc32 is used because Python's hash() changes
+    between processes.
+
+    Args:
+        subject: Email subject
+        sender: Email sender
+        body: Email body
+
+    Returns:
+        NumPy int array of feature indices (one entry per occurrence)
+    """
+    tokens = []
+    for prefix, text in (('s', subject), ('b', body)):
+        words = TOKEN_PATTERN.findall((text or '').lower())
+        tokens.extend(f"{prefix}:{word}" for word in words)
+        tokens.extend(f"{prefix}:{a} {b}" for a, b in zip(words, words[1:]))
+
+    address = parseaddr(sender or '')[1].lower()
+    if address:
+        tokens.append(f"f:{address}")
+        tokens.append(f"d:{address.rsplit('@', 1)[-1]}")
+
+    return np.fromiter(
+        (zlib.crc32(token.encode('utf-8')) for token in tokens),
+        dtype=np.uint32,
+        count=len(tokens)
+    ) % NUM_FEATURES
+
+
+class LocalModel:
+    """
+    Multinomial naive Bayes over hashed features.
+
+    Training only adds to per-class feature counts, so the model can be
+    updated one verdict at a time. The per-bucket log-count ratios are built
+    once, then only the buckets an email touches are updated when it is
+    learned; the per-class normalisation is kept as two running totals.
+    """
+
+    def __init__(self, feature_counts=None, doc_counts=None):
+        self.feature_counts = (feature_counts if feature_counts is not None
+                               else np.zeros((2, NUM_FEATURES), dtype=np.float32))
+        self.doc_counts = doc_counts if doc_counts is not None else np.zeros(2, dtype=np.int64)
+        self._count_ratio = None
+        self._totals = None
+
+    def learn(self, subject, sender, body, is_managebac):
+        """
+        Add one labeled email to the model.
+
+        Args:
+            subject: Email subject
+            sender: Email sender
+            body: Email body
+            is_managebac: Label for the email
+        """
+        label = int(bool(is_managebac))
+        features = extract_features(subject, sender, body)
+        np.add.at(self.feature_counts[label], features, 1)
+        self.doc_counts[label] += 1
+
+        if self._count_ratio is not None:
+            touched = np.unique(features)
+            self._count_ratio[touched] = self._log_count_ratio(touched)
+            self._totals[label] += len(features)
+
+    def _log_count_ratio(self, buckets=slice(None)):
+        # Laplace-smoothed log count(feature | ManageBac) - log count(feature | other)
+        smoothed = self.feature_counts[:, buckets] + 1.0
+        return (np.log(smoothed[1]) - np.log(smoothed[0])).astype(np.float32)
+
+    def _prepare(self):
+        self._count_ratio = self._log_count_ratio()
+        # Smoothed feature total per class: every bucket counts once more (Laplace)
+        self._totals = self.feature_counts.sum(axis=1, dtype=np.float64) + NUM_FEATURES
+
+    def predict_proba(self, subject, sender, body):
+        """
+        Estimate the probability that an email is ManageBac-related.
+
+        Args:
+            subject: Email subject
+            sender: Email sender
+            body: Email body
+
+        Returns:
+            Float between 0 and 1
+        """
+        if self._count_ratio is None:
+            self._prepare()
+
+        features = extract_features(subject, sender, body)
+        docs = self.doc_counts + 1
+        # log P(f|class) = log count(f|class) - log total(class), summed over the email's features
+        score = (
+            float(np.log(docs[1]) - np.log(docs[0]))
+            + float(self._count_ratio[features].sum())
+            - len(features) * float(np.log(self._totals[1]) - np.log(self._totals[0]))
+        )
+        # Clip so very long emails do not overflow exp()
+        return float(1.0 / (1.0 + np.exp(-np.clip(score, -50, 50))))
+
+    def save(self, path):
+        """
+        Save the model counts to a compressed .npz file.
+
+        Args:
+            path: Output file path
+        """
+        ensure_directory_exists(os.path.dirname(path) or '.')
+        # np.savez appends .npz to names without it, so write to a name that has it
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, feature_counts=self.feature_counts, doc_counts=self.doc_counts)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a model saved with save().
+
+        Args:
+            path: Model file path
+
+        Returns:
+            LocalModel instance
+        """
+        with np.load(path) as data:
+            return cls(data['feature_counts'], data['doc_counts'])
+
+
+def get_local_model_config():
+    """
+    Read the local model settings from the environment.
+
+    Returns:
+        Dictionary with local model settings
+    """
+    return {
+        'enabled': os.getenv('LOCAL_MODEL_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        'file': os.getenv('LOCAL_MODEL_FILE', '.tmp/local_model.npz'),
+        'threshold': float(os.getenv('LOCAL_MODEL_THRESHOLD', 0.98)),
+        'min_docs': int(os.getenv('LOCAL_MODEL_MIN_DOCS', 50))
+    }
+
+
+def get_local_model():
+    """
+    Load the process-wide model (once per process).
+
+    Returns:
+        LocalModel instance (empty if no model file exists yet)
+    """
+    global _model, _base_counts
+    if _model is None:
+        path = get_local_model_config()['file']
+        _model = LocalModel()
+        if os.path.exists(path):
+            try:
+                _model = LocalModel.load(path)
+                logger.info(
+                    f"Loaded local model ({_model.doc_counts[1]} ManageBac / "
+                    f"{_model.doc_counts[0]} other emails)"
+                )
+            except Exception as e:
+                logger.error(f"Error loading local model, starting empty: {e}")
+        _base_counts = (_model.feature_counts.copy(), _model.doc_counts.copy())
+    return _model
+
+
+def predict_local(subject, sender, body):
+    """
+    Decide an email locally if the model is trained and confident.
+
+    Args:
+        subject: Email subject
+        sender: Email sender
+        body: Email body
+
+    Returns:
+        Dictionary with is_managebac and probability, or None if undecided
+    """
+    config = get_local_model_config()
+    if not config['enabled']:
+        return None
+
+    model = get_local_model()
+    # Too few examples of either class and the probabilities mean nothing
+    if model.doc_counts.min() < config['min_docs']:
+        return None
+
+    probability = model.predict_proba(subject, sender, body)
+    if probability >= config['threshold']:
+        return {'is_managebac': True, 'probability': probability}
+    if probability <= 1 - config['threshold']:
+        return {'is_managebac': False, 'probability': probability}
+
+    return None
+
+
+def learn_local(subject, sender, body, is_managebac):
+    """
+    Incrementally train the process-wide model on a new verdict.
+
+    Args:
+        subject: Email subject
+        sender: Email sender
+        body: Email body
+        is_managebac: Verdict for the email
+    """
+    if get_local_model_config()['enabled']:
+        get_local_model().learn(subject, sender, body, is_managebac)
+
+
+def save_local_model(replace=False):
+    """
+    Merge what the process-wide model learned into the model file.
+
+    Counts are additive, so the file is re-read under a lock and only the
+    counts learned since this process loaded it are added; several workers
+    saving the same file each keep their learning.
+
+    Args:
+        replace: Overwrite the file with this model instead (after a full retrain)
+    """
+    global _model, _base_counts
+    if _model is None:
+        return
+
+    path = get_local_model_config()['file']
+    try:
+        with file_lock(path):
+            model = _model
+            if not replace and _base_counts is not None and os.path.exists(path):
+                model = LocalModel.load(path)
+                model.feature_counts += _model.feature_counts - _base_counts[0]
+                model.doc_counts += _model.doc_counts - _base_counts[1]
+            model.save(path)
+
+        _model = model
+        _base_counts = (model.feature_counts.copy(), model.doc_counts.copy())
+        logger.info(f"Saved local model to {path}")
+    except Exception as e:
+        logger.error(f"Error saving local model: {e}")
+
+
+def load_recorded_negatives(days):
+    """
+    Collect IDs of emails the pipeline itself classified as not ManageBac.
+
+    Read from the per-email results JSONL (results_sink.py). Only verdicts
+    from rules and the keyword/LLM tiers count: reputation and local model
+    verdicts would feed the model its own guesses. If an email was decided
+    more than once, the latest record wins. Without any results, the IDs in
+    processed_ids.json are used (the caller drops the labeled ones).
+
+    Args:
+        days: Ignore records older than this
+
+    Returns:
+        List of message IDs, oldest first
+    """
+    import glob
+    import json
+    from datetime import datetime, timedelta
+
+    results_dir = os.getenv('RESULTS_DIR', '.tmp/results')
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+    # Rotated files first (their names start with the run's timestamp), then the live file
+    paths = sorted(glob.glob(os.path.join(results_dir, 'results-*.jsonl')))
+    paths.append(os.path.join(results_dir, 'results.jsonl'))
+
+    verdicts = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if (record.get('error') is None and record.get('verdict') is not None
+                        and record.get('decision_path') in TRAINING_TIERS
+                        and record.get('timestamp', '') >= cutoff):
+                    verdicts[record['id']] = record['verdict']
+
+    if verdicts:
+        return [email_id for email_id, verdict in verdicts.items() if not verdict]
+
+    from run_scheduler import load_processed_ids
+    logger.warning("No recorded verdicts in results; using processed IDs as negatives")
+    return list(load_processed_ids())
+
+
+def train_from_mailbox(service, max_per_class=500, days=180):
+    """
+    Rebuild the model: labeled mail vs mail the pipeline recorded as not ManageBac.
+
+    Unlabeled mail in general is not used as the negative class: the pipeline
+    only ever sees unread mail, so ManageBac mail that was read before a run
+    (or arrived before the pipeline existed) is unlabeled too.
+
+    Args:
+        service: Authenticated Gmail API service
+        max_per_class: Maximum emails to fetch per class
+        days: How far back to look
+
+    Returns:
+        Trained LocalModel instance
+    """
+    from fetch_emails import search_messages, get_email_content
+
+    global _model
+    label_name = os.getenv('MANAGEBAC_LABEL_NAME', 'ManageBac')
+    positives = search_messages(service, f"label:{label_name} newer_than:{days}d", max_per_class)
+    labeled_ids = {message['id'] for message in search_messages(service, f"label:{label_name}", 100000)}
+    # Newest recorded verdicts first; emails labeled since (e.g. by hand) are not negatives
+    negatives = [email_id for email_id in reversed(load_recorded_negatives(days)) if email_id not in labeled_ids]
+    negatives = [{'id': email_id} for email_id in negatives[:max_per_class]]
+
+    model = LocalModel()
+    for is_managebac, messages in ((True, positives), (False, negatives)):
+        logger.info(f"Training on {len(messages)} {'ManageBac' if is_managebac else 'other'} emails")
+
+        for message in messages:
+            content = get_email_content(service, message['id'])
+            if content:
+                model.learn(content['subject'], content['sender'], content['body'], is_managebac)
+
+    _model = model
+    save_local_model(replace=True)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local ManageBac pre-filter model")
+    parser.add_argument('command', nargs='?', choices=['status', 'train'], default='status')
+    parser.add_argument('--max-per-class', type=int, default=500, help="Emails to fetch per class")
+    parser.add_argument('--days', type=int, default=180, help="How far back to look for training mail")
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        from gmail_auth import get_gmail_service
+
+        print("Training Local Model...")
+        print("-" * 50)
+        model = train_from_mailbox(get_gmail_service(), args.max_per_class, args.days)
+    else:
+        print("Local Model Status...")
+        print("-" * 50)
+        model = get_local_model()
+
+    print(f"\nManageBac emails: {model.doc_counts[1]}")
+    print(f"Other emails: {model.doc_counts[0]}")
+    print(f"Threshold: {get_local_model_config()['threshold']}")
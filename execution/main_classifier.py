@@ -6,13 +6,23 @@ Last Updated: 2025-12-11
 """
 
 import os
+import time
 from datetime import datetime
+from email.utils import parseaddr
 from dotenv import load_dotenv
 from gmail_auth import get_gmail_service
 from fetch_emails import fetch_unprocessed_emails, get_email_content
-from classify_email import classify_email
+from classify_email import classify_email_detailed, get_cascade_report
 from apply_label import get_or_create_label, apply_label_to_email
-from utils import setup_logging
+from sender_reputation import save_reputation_store
+from content_store import get_content_store
+from local_model import save_local_model
+from run_scheduler import (
+    DeadlineScheduler, load_backlog, save_backlog, merge_candidates, load_processed_ids, save_processed_ids
+)
+from results_sink import open_results_sink
+from tracing import span
+from utils import setup_logging, RUN_RETRY_BUDGET
 
 # Load environment variables
 load_dotenv()
@@ -21,6 +31,95 @@ load_dotenv()
 logger = setup_logging("main_classifier")
 
 
+def process_email(service, email, label_id, stats):
+    """
+    Fetch, classify and (if ManageBac-related) label a single email.
+    
+    Args:
+        service: Authenticated Gmail API service
+        email: Email dictionary with 'id'
+        label_id: ManageBac label ID
+        stats: Run statistics dictionary, updated in place
+        
+    Returns:
+        Result dictionary (id, thread_id, sender_domain, verdict, decision_path,
+        confidence, model, tokens, label_applied, error) with stage timings in
+        seconds under 'timings' ('fetch', 'classify', 'label')
+    """
+    result = {
+        'id': email['id'],
+        'thread_id': email.get('threadId'),
+        'sender_domain': None,
+        'verdict': None,
+        'decision_path': None,
+        'confidence': None,
+        'model': None,
+        'tokens': 0,
+        'label_applied': False,
+        'error': None,
+        'timings': {}
+    }
+    timings = result['timings']
+    
+    # Get email content
+    stage_start = time.perf_counter()
+    with span('fetch', email_id=email['id']) as stage_span:
+        content = get_email_content(service, email['id'])
+        stage_span.set_attribute('found', content is not None)
+    timings['fetch'] = time.perf_counter() - stage_start
+    if not content:
+        logger.error(f"Failed to get content for email {email['id']}")
+        stats['errors'] += 1
+        result['error'] = 'content_unavailable'
+        return result
+    
+    logger.info(f"From: {content['sender']}")
+    logger.info(f"Subject: {content['subject']}")
+    address = parseaddr(content['sender'])[1].lower()
+    result['sender_domain'] = address.rsplit('@', 1)[1] if '@' in address else None
+    
+    # Classify with AI
+    stage_start = time.perf_counter()
+    with span('classify') as stage_span:
+        classification = classify_email_detailed(
+            content['subject'],
+            content['sender'],
+            content['body']
+        )
+        stage_span.set_attribute('decision_path', classification['tier'])
+        stage_span.set_attribute('verdict', classification['is_managebac'])
+    timings['classify'] = time.perf_counter() - stage_start
+    is_managebac = classification['is_managebac']
+    result.update({
+        'verdict': is_managebac,
+        'decision_path': classification['tier'],
+        'confidence': classification['confidence'],
+        'model': classification['model'],
+        'tokens': classification['tokens']
+    })
+    
+    # Apply label if ManageBac-related
+    if is_managebac:
+        stage_start = time.perf_counter()
+        with span('label') as stage_span:
+            success = apply_label_to_email(service, email['id'], label_id)
+            stage_span.set_attribute('success', success)
+        timings['label'] = time.perf_counter() - stage_start
+        if success:
+            stats['managebac'] += 1
+            result['label_applied'] = True
+            logger.info(f"✅ LABELED as ManageBac")
+        else:
+            stats['errors'] += 1
+            result['error'] = 'label_failed'
+            logger.error(f"Failed to apply label")
+    else:
+        stats['not_managebac'] += 1
+        logger.info(f"⏭️  SKIPPED (not ManageBac-related)")
+    
+    return result
+
+
 def main():
     """
     Main workflow orchestrator.
@@ -28,10 +127,15 @@ def main():
     Process:
     1. Authenticate with Gmail
     2. Get or create ManageBac label
-    3. Fetch unprocessed emails
+    3. Fetch unprocessed emails (backlog from earlier runs first)
     4. Classify each email with AI
     5. Apply label to ManageBac-related emails
     6. Log results
+    
+    With RUN_TIME_BUDGET_SECONDS set, emails are processed until the
+    estimated time for the next one no longer fits the budget; otherwise up
+    to MAX_EMAILS_PER_RUN are processed. Emails not reached are saved to the
+    backlog for the next run.
     """
     start_time = datetime.now()
     logger.info("=" * 60)
@@ -39,6 +143,17 @@ def main():
     logger.info(f"Timestamp: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("=" * 60)
     
+    time_budget = os.getenv('RUN_TIME_BUDGET_SECONDS')
+    scheduler = None
+    if time_budget:
+        scheduler = DeadlineScheduler(
+            budget_seconds=float(time_budget),
+            reserve_seconds=float(os.getenv('RUN_RESERVE_SECONDS', 15))
+        )
+        # Retry sleeps (e.g. a long Retry-After) must not eat into the reserve either
+        RUN_RETRY_BUDGET.set_deadline(scheduler.deadline - scheduler.reserve_seconds)
+        logger.info(f"Time budget mode: {float(time_budget):.0f} seconds")
+    
     try:
         # Step 1: Authenticate with Gmail
         logger.info("Step 1: Authenticating with Gmail...")
@@ -49,64 +164,88 @@ def main():
         logger.info(f"Step 2: Getting/creating label '{label_name}'...")
         label_id = get_or_create_label(service, label_name)
         
-        # Step 3: Fetch unprocessed emails
+        # Step 3: Fetch unprocessed emails, after whatever earlier runs left over.
+        # Emails earlier runs already decided (e.g. NO verdicts) are skipped.
         max_emails = int(os.getenv('MAX_EMAILS_PER_RUN', 50))
-        logger.info(f"Step 3: Fetching up to {max_emails} unprocessed emails...")
-        emails = fetch_unprocessed_emails(service, max_results=max_emails)
+        fetch_limit = int(os.getenv('RUN_MAX_CANDIDATES', 500)) if scheduler else max_emails
+        logger.info(f"Step 3: Fetching up to {fetch_limit} unprocessed emails...")
+        backlog = load_backlog()
+        processed = load_processed_ids()
+        fetched = fetch_unprocessed_emails(service, max_results=fetch_limit, exclude_ids=processed)
+        emails = merge_candidates(backlog, fetched, processed)
         
         if not emails:
             logger.info("✅ No unprocessed emails found. All done!")
             return
         
-        logger.info(f"Found {len(emails)} emails to process")
+        logger.info(f"Found {len(emails)} emails to process ({len(backlog)} from backlog)")
         
         # Step 4 & 5: Process each email
         stats = {
-            'total': len(emails),
+            'total': 0,
             'managebac': 0,
             'not_managebac': 0,
-            'errors': 0
+            'errors': 0,
+            'deferred': 0
         }
         
+        # Checkpoint the full candidate list first: a hard kill then loses nothing
+        save_backlog(emails)
+        
+        # Per-email results export (JSONL + Parquet)
+        sink = open_results_sink(run_id=start_time.strftime('%Y%m%d-%H%M%S'))
+        
         for i, email in enumerate(emails, 1):
+            if scheduler and not scheduler.has_time_for_next():
+                logger.info(
+                    f"⏱️  Time budget nearly spent ({scheduler.remaining():.0f}s left, "
+                    f"~{scheduler.estimate_per_email():.1f}s per email)"
+                )
+                break
+            if not scheduler and i > max_emails:
+                break
+            
             try:
                 logger.info(f"\n{'='*60}")
                 logger.info(f"Processing email {i}/{len(emails)}")
                 logger.info(f"{'='*60}")
                 
-                # Get email content
-                content = get_email_content(service, email['id'])
-                if not content:
-                    logger.error(f"Failed to get content for email {email['id']}")
-                    stats['errors'] += 1
-                    continue
-                
-                logger.info(f"From: {content['sender']}")
-                logger.info(f"Subject: {content['subject']}")
-                
-                # Classify with AI
-                is_managebac = classify_email(
-                    content['subject'],
-                    content['sender'],
-                    content['body']
-                )
-                
-                # Apply label if ManageBac-related
-                if is_managebac:
-                    success = apply_label_to_email(service, email['id'], label_id)
-                    if success:
-                        stats['managebac'] += 1
-                        logger.info(f"✅ LABELED as ManageBac")
-                    else:
-                        stats['errors'] += 1
-                        logger.error(f"Failed to apply label")
-                else:
-                    stats['not_managebac'] += 1
-                    logger.info(f"⏭️  SKIPPED (not ManageBac-related)")
+                # Each email is its own trace; stage and API spans nest under it
+                with span('process_email', email_id=email['id']) as email_span:
+                    result = process_email(service, email, label_id, stats)
+                    result['trace_id'] = email_span.trace_id
+                if scheduler:
+                    for stage, seconds in result['timings'].items():
+                        scheduler.record_stage(stage, seconds)
+                if sink:
+                    sink.write(result)
+                if not result['error']:
+                    processed[email['id']] = datetime.now().isoformat(timespec='seconds')
                 
             except Exception as e:
                 logger.error(f"Error processing email {email['id']}: {e}")
                 stats['errors'] += 1
+                if sink:
+                    sink.write({'id': email['id'], 'thread_id': email.get('threadId'), 'error': str(e)})
+            
+            stats['total'] += 1
+            save_backlog(emails[i:])
+            save_processed_ids(processed)
+        
+        # Whatever was not reached waits in the backlog for the next run
+        stats['deferred'] = len(emails) - stats['total']
+        
+        if sink:
+            sink.close()
+        
+        # Persist what was learned about senders and content for the next run
+        save_reputation_store()
+        save_local_model()
+        
+        # Keep the content cache within its size and age limits
+        store = get_content_store()
+        if store:
+            store.evict()
         
         # Step 6: Log results
         end_time = datetime.now()
@@ -119,7 +258,14 @@ def main():
         logger.info(f"  ✅ Labeled as ManageBac: {stats['managebac']}")
         logger.info(f"  ⏭️  Not ManageBac: {stats['not_managebac']}")
         logger.info(f"  ❌ Errors: {stats['errors']}")
+        logger.info(f"  ⏳ Deferred to next run: {stats['deferred']}")
         logger.info(f"Duration: {duration:.2f} seconds")
+        logger.info("Classification tiers:")
+        for tier, tier_stats in get_cascade_report().items():
+            logger.info(
+                f"  {tier}: {tier_stats['hits']} hits ({tier_stats['hit_rate']:.0%}), "
+                f"avg {tier_stats['avg_seconds']:.2f}s, {tier_stats['tokens']} tokens"
+            )
         logger.info(f"Timestamp: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info("=" * 60)
         
@@ -0,0 +1,167 @@
+"""
+Bulk Reclassification
+Purpose: Re-runs classification over already-labeled mail and applies the label diff in bulk
+Author: AI Agent
+Last Updated: 2026-10-19
+
+Usage:
+    python execution/reclassify.py --dry-run                      # Report what would change
+    python execution/reclassify.py                                # Remove the label where it no longer applies
+    python execution/reclassify.py --use-learned                  # Also let reputation/local model decide
+    python execution/reclassify.py --candidates "newer_than:90d"  # Also label matching unlabeled mail
+    python execution/reclassify.py --dry-run --output .tmp/reclassify.json
+"""
+
+import os
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from gmail_auth import get_gmail_service
+from fetch_emails import search_messages, get_email_content
+from classify_email import classify_email_detailed, get_cascade_report
+from apply_label import get_or_create_label, batch_modify_labels, list_user_labels
+from utils import setup_logging, RUN_RETRY_BUDGET, get_retry_refill_rate
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("reclassify")
+
+
+def reclassify(service_factory, candidates_query=None, max_results=10000, workers=8, dry_run=False,
+               use_learned=False):
+    """
+    Re-classify labeled (and optionally unlabeled candidate) emails and fix their labels.
+
+    Labeled emails now classified as not ManageBac lose the label; candidate
+    emails now classified as ManageBac gain it. Content comes from the content
+    store when cached. Verdicts from the error fallback never change a label.
+    Nothing is learned from the new verdicts, so every email is judged
+    independently of the others in the same run.
+
+    Args:
+        service_factory: Callable returning an authenticated Gmail API service;
+                         called once per worker thread (service objects are not thread-safe)
+        candidates_query: Gmail query for unlabeled emails to check as well (None = labeled mail only)
+        max_results: Maximum emails to scan per query
+        workers: Concurrent fetch/classify threads
+        dry_run: Report the diff without modifying any labels
+        use_learned: Let sender reputation and the local model decide too; off by
+                     default because both were learned from the verdicts being re-checked
+
+    Returns:
+        Dictionary with scanned/unchanged/errors counts, the 'add' and 'remove'
+        change lists, and the number of emails actually modified
+    """
+    # Thousands of calls on several threads: let spent retries come back over time
+    RUN_RETRY_BUDGET.set_refill(get_retry_refill_rate())
+
+    service = service_factory()
+    label_name = os.getenv('MANAGEBAC_LABEL_NAME', 'ManageBac')
+    if dry_run:
+        # Report-only: never create the label, just look it up
+        label_id = next(
+            (label['id'] for label in list_user_labels(service) if label['name'].lower() == label_name.lower()),
+            None
+        )
+        if label_id is None:
+            logger.info(f"Label '{label_name}' does not exist yet; nothing to reclassify")
+            return {'scanned': 0, 'unchanged': 0, 'errors': 0, 'add': [], 'remove': [], 'modified': 0}
+    else:
+        label_id = get_or_create_label(service, label_name)
+
+    # (message, currently labeled) pairs; Gmail returns each list newest first
+    messages = [(m, True) for m in search_messages(service, f"label:{label_name}", max_results)]
+    if candidates_query:
+        candidates = search_messages(service, f"({candidates_query}) -label:{label_name}", max_results)
+        messages += [(m, False) for m in candidates]
+    logger.info(f"Reclassifying {len(messages)} emails with {workers} workers")
+
+    local = threading.local()
+
+    def evaluate(entry):
+        message, labeled = entry
+        if not hasattr(local, 'service'):
+            local.service = service_factory()
+
+        content = get_email_content(local.service, message['id'])
+        if not content:
+            return {'id': message['id'], 'labeled': labeled, 'error': 'content unavailable'}
+
+        result = classify_email_detailed(
+            content['subject'], content['sender'], content['body'], learn=False, use_learned=use_learned
+        )
+        return {
+            'id': message['id'],
+            'labeled': labeled,
+            'is_managebac': result['is_managebac'],
+            'tier': result['tier'],
+            'subject': content['subject'],
+            'sender': content['sender'],
+            'error': 'classification failed' if result['tier'] == 'fallback' else None
+        }
+
+    report = {'scanned': len(messages), 'unchanged': 0, 'errors': 0, 'add': [], 'remove': [], 'modified': 0}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for outcome in pool.map(evaluate, messages):
+            if outcome['error']:
+                logger.warning(f"Keeping label state of {outcome['id']}: {outcome['error']}")
+                report['errors'] += 1
+            elif outcome['is_managebac'] == outcome['labeled']:
+                report['unchanged'] += 1
+            else:
+                change = {k: outcome[k] for k in ('id', 'subject', 'sender', 'tier')}
+                report['add' if outcome['is_managebac'] else 'remove'].append(change)
+
+    for action in ('remove', 'add'):
+        for change in report[action]:
+            logger.info(f"{action.upper():<7}{change['id']}  [{change['tier']}] {change['sender']} - {change['subject'][:60]}")
+
+    if not dry_run:
+        if report['remove']:
+            report['modified'] += batch_modify_labels(
+                service, [c['id'] for c in report['remove']], remove_label_ids=[label_id]
+            )
+        if report['add']:
+            report['modified'] += batch_modify_labels(
+                service, [c['id'] for c in report['add']], add_label_ids=[label_id]
+            )
+
+    logger.info("=" * 50)
+    logger.info(f"Reclassification {'dry run ' if dry_run else ''}complete:")
+    logger.info(f"  Scanned: {report['scanned']}")
+    logger.info(f"  Unchanged: {report['unchanged']}")
+    logger.info(f"  Label removed: {len(report['remove'])}")
+    logger.info(f"  Label added: {len(report['add'])}")
+    logger.info(f"  Errors (left as is): {report['errors']}")
+    if not dry_run:
+        logger.info(f"  Emails modified: {report['modified']}")
+    for tier, tier_stats in get_cascade_report().items():
+        logger.info(f"  Tier {tier}: {tier_stats['hits']} hits ({tier_stats['hit_rate']:.0%})")
+    logger.info("=" * 50)
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-classify labeled ManageBac emails and fix their labels")
+    parser.add_argument('--dry-run', action='store_true', help="Report the diff without changing labels")
+    parser.add_argument('--candidates', help="Gmail query for unlabeled emails to check for a missing label")
+    parser.add_argument('--max', type=int, default=10000, help="Maximum emails to scan per query")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent fetch/classify threads")
+    parser.add_argument('--use-learned', action='store_true',
+                        help="Also consult sender reputation and the local model (they reflect the old verdicts)")
+    parser.add_argument('--output', help="Write the diff report as JSON")
+    args = parser.parse_args()
+
+    report = reclassify(get_gmail_service, args.candidates, args.max, args.workers, args.dry_run,
+                        args.use_learned)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
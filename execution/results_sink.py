@@ -0,0 +1,156 @@
+"""
+Results Sink Module
+Purpose: Streams one record per processed email to rotating JSONL and batched Parquet files
+Author: AI Agent
+Last Updated: 2026-10-19
+"""
+
+import os
+import json
+from datetime import datetime
+from dotenv import load_dotenv
+from utils import setup_logging, ensure_directory_exists
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("results_sink")
+
+
+class ResultsSink:
+    """
+    Append-only per-email results export.
+
+    Each record is written to results.jsonl immediately (flushed, so a killed
+    run keeps everything written so far); the file is rotated once it passes
+    max_jsonl_bytes. Records are also buffered and written to Parquet part
+    files every parquet_batch_size records, so memory stays bounded no
+    matter how long the run is.
+    """
+
+    def __init__(self, directory, max_jsonl_bytes, parquet_batch_size, run_id=None):
+        self.directory = directory
+        self.parquet_dir = os.path.join(directory, 'parquet')
+        self.max_jsonl_bytes = max_jsonl_bytes
+        self.parquet_batch_size = parquet_batch_size
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.jsonl_path = os.path.join(directory, 'results.jsonl')
+        self.buffer = []
+        self.part = 0
+        self.rotation = 0
+        self.parquet_enabled = parquet_batch_size > 0
+
+        ensure_directory_exists(directory)
+        self.jsonl_file = open(self.jsonl_path, 'a', encoding='utf-8')
+
+    def write(self, result):
+        """
+        Record the outcome of one email.
+
+        Args:
+            result: Result dictionary; a nested 'timings' dict is flattened
+                    into '<stage>_seconds' columns
+        """
+        record = {'run_id': self.run_id, 'timestamp': datetime.now().isoformat(timespec='milliseconds')}
+        for key, value in result.items():
+            if key == 'timings':
+                record.update({f"{stage}_seconds": seconds for stage, seconds in value.items()})
+            else:
+                record[key] = value
+
+        self.jsonl_file.write(json.dumps(record) + '\n')
+        self.jsonl_file.flush()
+        if self.jsonl_file.tell() >= self.max_jsonl_bytes:
+            self.rotate_jsonl()
+
+        if self.parquet_enabled:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.parquet_batch_size:
+                self.flush_parquet()
+
+    def rotate_jsonl(self):
+        """Move the current JSONL file aside and start a new one."""
+        self.jsonl_file.close()
+        # run_id plus a counter: os.replace would silently overwrite an earlier rotation
+        rotated = os.path.join(self.directory, f"results-{self.run_id}-{self.rotation:04d}.jsonl")
+        while os.path.exists(rotated):
+            self.rotation += 1
+            rotated = os.path.join(self.directory, f"results-{self.run_id}-{self.rotation:04d}.jsonl")
+        self.rotation += 1
+        os.replace(self.jsonl_path, rotated)
+        logger.info(f"Rotated results to {rotated}")
+        self.jsonl_file = open(self.jsonl_path, 'a', encoding='utf-8')
+
+    def flush_parquet(self):
+        """Write buffered records to a new Parquet part file."""
+        if not self.buffer:
+            return
+
+        try:
+            import pandas as pd
+
+            ensure_directory_exists(self.parquet_dir)
+            path = os.path.join(self.parquet_dir, f"part-{self.run_id}-{self.part:04d}.parquet")
+            pd.DataFrame(self.buffer).to_parquet(path, index=False)
+            self.part += 1
+        except ImportError as e:
+            # to_parquet needs pyarrow; JSONL export keeps working without it
+            logger.warning(f"Parquet export disabled ({e}); results are still written as JSONL")
+            self.parquet_enabled = False
+        except Exception as e:
+            logger.error(f"Error writing Parquet results: {e}")
+
+        self.buffer = []
+
+    def close(self):
+        """Flush remaining records and close the JSONL file."""
+        if self.parquet_enabled:
+            self.flush_parquet()
+        self.jsonl_file.close()
+
+
+def open_results_sink(run_id=None):
+    """
+    Open a results sink configured from the environment.
+
+    Args:
+        run_id: Identifier stored with every record (defaults to the start time)
+
+    Returns:
+        ResultsSink instance, or None if RESULTS_EXPORT_ENABLED is false or it cannot be opened
+    """
+    if os.getenv('RESULTS_EXPORT_ENABLED', 'true').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    try:
+        return ResultsSink(
+            directory=os.getenv('RESULTS_DIR', '.tmp/results'),
+            max_jsonl_bytes=int(float(os.getenv('RESULTS_JSONL_MAX_MB', 50)) * 1024 * 1024),
+            parquet_batch_size=int(os.getenv('RESULTS_PARQUET_BATCH_SIZE', 500)),
+            run_id=run_id
+        )
+    except Exception as e:
+        logger.error(f"Error opening results sink, continuing without export: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    import glob
+    import pandas as pd
+
+    print("Testing Results Sink...")
+    print("-" * 50)
+
+    results_dir = os.getenv('RESULTS_DIR', '.tmp/results')
+    parts = sorted(glob.glob(os.path.join(results_dir, 'parquet', '*.parquet')))
+    if not parts:
+        print("No Parquet results yet")
+    else:
+        df = pd.concat(pd.read_parquet(part) for part in parts)
+        print(f"Records: {len(df)} from {df['run_id'].nunique()} runs")
+        print("\nDecision paths:")
+        print(df['decision_path'].value_counts(normalize=True).to_string())
+        if 'classify_seconds' in df:
+            print("\nClassify latency (s):")
+            print(df['classify_seconds'].describe(percentiles=[0.5, 0.95, 0.99]).to_string())
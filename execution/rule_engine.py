@@ -0,0 +1,265 @@
+"""
+Rule Engine Module
+Purpose: Deterministic pre-AI routing with indexed sender, domain and keyword rules
+Author: AI Agent
+Last Updated: 2026-10-19
+"""
+
+import os
+import re
+import json
+from email.utils import parseaddr
+from dotenv import load_dotenv
+from utils import setup_logging
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("rule_engine")
+
+# Rules that always apply, even without a rules file
+BUILTIN_RULES = {
+    'domains': {'managebac.com': True}
+}
+
+# Compiled engine, shared by every evaluation in this process
+_engine = None
+
+
+def build_trie_regex(phrases):
+    """
+    Build a regex alternation from phrases, factored by common prefixes.
+
+    A plain 'a|b|c' alternation retries every phrase at every position; a
+    prefix-factored one walks each character once, so thousands of phrases
+    still match in a single fast pass.
+
+    Args:
+        phrases: Iterable of literal phrases (already lowercased)
+
+    Returns:
+        Regex source string (without word boundaries)
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def to_regex(node):
+        is_end = '' in node
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+
+        if not branches:
+            return ''
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+
+        alternation = '(?:' + '|'.join(branches) + ')'
+        return alternation + '?' if is_end else alternation
+
+    return to_regex(trie)
+
+
+def compile_keyword_pattern(phrases):
+    """
+    Compile phrases into one case-insensitive, word-bounded matcher.
+
+    Args:
+        phrases: Iterable of literal phrases
+
+    Returns:
+        Compiled regex, or None if there are no phrases
+    """
+    phrases = {phrase.lower() for phrase in phrases if phrase}
+    if not phrases:
+        return None
+
+    return re.compile(r'(?<!\w)' + build_trie_regex(phrases) + r'(?!\w)', re.IGNORECASE)
+
+
+class RuleEngine:
+    """
+    Indexed rule set evaluated before any AI call.
+
+    Precedence: exact sender, then most specific domain (a rule for
+    'school.org' also covers 'mail.school.org'), then subject keywords, then
+    body keywords. Conflicting keyword verdicts leave the email undecided.
+    """
+
+    def __init__(self, rules):
+        self.senders = {}
+        self.domains = {}
+        self.domain_trie = {}
+        self.keyword_verdicts = {'subject': {}, 'body': {}}
+
+        for rule_set in (BUILTIN_RULES, rules):
+            self.senders.update({k.lower(): v for k, v in rule_set.get('senders', {}).items()})
+            self.domains.update({k.lower(): v for k, v in rule_set.get('domains', {}).items()})
+            for field in ('subject', 'body'):
+                self.keyword_verdicts[field].update(
+                    {k.lower(): v for k, v in rule_set.get(f'{field}_keywords', {}).items()}
+                )
+
+        # Suffix trie over reversed domain labels: org -> school -> mail
+        for domain, verdict in self.domains.items():
+            node = self.domain_trie
+            for part in reversed(domain.split('.')):
+                node = node.setdefault(part, {})
+            node[''] = verdict
+
+        self.keyword_patterns = {
+            field: compile_keyword_pattern(verdicts)
+            for field, verdicts in self.keyword_verdicts.items()
+        }
+
+    def __len__(self):
+        return (len(self.senders) + len(self.domains)
+                + sum(len(verdicts) for verdicts in self.keyword_verdicts.values()))
+
+    def match_domain(self, domain):
+        """
+        Find the most specific domain rule covering a domain.
+
+        Args:
+            domain: Sender domain, e.g. 'mail.school.org'
+
+        Returns:
+            Tuple (verdict, matched_domain), or (None, None) if no rule covers it
+        """
+        # Exact domains are a plain hash lookup
+        if domain in self.domains:
+            return self.domains[domain], domain
+
+        node = self.domain_trie
+        parts = domain.split('.')
+        verdict, matched = None, None
+        for i, part in enumerate(reversed(parts)):
+            node = node.get(part)
+            if node is None:
+                break
+            if '' in node:
+                verdict, matched = node[''], '.'.join(parts[len(parts) - i - 1:])
+
+        return verdict, matched
+
+    def match_keywords(self, field, text):
+        """
+        Find the keyword verdict for one field.
+
+        Args:
+            field: 'subject' or 'body'
+            text: Field text
+
+        Returns:
+            Tuple (verdict, matched_keywords); verdict is None if nothing or
+            conflicting rules matched
+        """
+        pattern = self.keyword_patterns[field]
+        if pattern is None or not text:
+            return None, []
+
+        verdict_map = self.keyword_verdicts[field]
+        matched = {match.group(0).lower() for match in pattern.finditer(text)} & verdict_map.keys()
+        verdicts = {verdict_map[keyword] for keyword in matched}
+        if len(verdicts) != 1:
+            return None, sorted(matched)
+
+        return verdicts.pop(), sorted(matched)
+
+    def evaluate(self, subject, sender, body):
+        """
+        Evaluate all rules against an email.
+
+        Args:
+            subject: Email subject
+            sender: Email sender
+            body: Email body
+
+        Returns:
+            Dictionary with is_managebac and rule, or None if no rule decides
+        """
+        address = parseaddr(sender)[1].lower()
+
+        if address in self.senders:
+            return {'is_managebac': self.senders[address], 'rule': f'sender:{address}'}
+
+        if '@' in address:
+            verdict, domain = self.match_domain(address.rsplit('@', 1)[1])
+            if verdict is not None:
+                return {'is_managebac': verdict, 'rule': f'domain:{domain}'}
+
+        for field, text in (('subject', subject), ('body', body)):
+            verdict, keywords = self.match_keywords(field, text)
+            if verdict is not None:
+                return {'is_managebac': verdict, 'rule': f"{field}:{','.join(keywords)}"}
+
+        return None
+
+
+def load_rules(path=None):
+    """
+    Load and compile rules from a JSON file.
+
+    Args:
+        path: Rules file path (defaults to CLASSIFICATION_RULES_FILE)
+
+    Returns:
+        RuleEngine instance (built-in rules only if the file does not exist)
+    """
+    path = path or os.getenv('CLASSIFICATION_RULES_FILE', 'classification_rules.json')
+    rules = {}
+
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                rules = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading rules from {path}, using built-in rules only: {e}")
+            rules = {}
+
+    engine = RuleEngine(rules)
+    logger.info(f"Loaded {len(engine)} classification rules")
+    return engine
+
+
+def evaluate_rules(subject, sender, body):
+    """
+    Evaluate the process-wide rule engine against an email.
+
+    Args:
+        subject: Email subject
+        sender: Email sender
+        body: Email body
+
+    Returns:
+        Dictionary with is_managebac and rule, or None if no rule decides
+    """
+    global _engine
+    if _engine is None:
+        _engine = load_rules()
+
+    return _engine.evaluate(subject, sender, body)
+
+
+if __name__ == "__main__":
+    import time
+
+    print("Testing Rule Engine...")
+    print("-" * 50)
+
+    engine = load_rules()
+    test_emails = [
+        ("New assignment posted", "ManageBac <noreply@managebac.com>", ""),
+        ("New assignment posted", "notifications@eu.managebac.com", ""),
+        ("Your order has shipped", "auto-confirm@amazon.com", "Order #123456"),
+    ]
+
+    for subject, sender, body in test_emails:
+        start = time.perf_counter()
+        result = engine.evaluate(subject, sender, body)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(f"\n{sender} / {subject}")
+        print(f"Result: {result} ({elapsed_us:.0f}µs)")
@@ -0,0 +1,242 @@
+"""
+Run Scheduler Module
+Purpose: Time-budgeted processing with a persisted backlog of emails a run did not reach
+         and a record of emails already decided
+Author: AI Agent
+Last Updated: 2026-10-19
+"""
+
+import os
+import json
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from utils import setup_logging, ensure_directory_exists
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("run_scheduler")
+
+
+class DeadlineScheduler:
+    """
+    Decides whether another email fits in the remaining run time.
+
+    Per-email cost is estimated from live stage timings (fetch, classify,
+    label), each tracked as an exponentially weighted moving average, so the
+    estimate follows the run as it speeds up (cache hits) or slows down
+    (rate limits).
+    """
+
+    def __init__(self, budget_seconds, reserve_seconds=15.0, safety_factor=1.5, smoothing=0.3):
+        self.start = time.monotonic()
+        self.deadline = self.start + budget_seconds
+        self.reserve_seconds = reserve_seconds
+        self.safety_factor = safety_factor
+        self.smoothing = smoothing
+        self.stage_estimates = {}
+
+    def record_stage(self, stage, seconds):
+        """
+        Feed a measured stage duration into the estimate.
+
+        Args:
+            stage: Stage name (e.g. 'fetch', 'classify', 'label')
+            seconds: How long the stage took
+        """
+        previous = self.stage_estimates.get(stage)
+        if previous is None:
+            self.stage_estimates[stage] = seconds
+        else:
+            self.stage_estimates[stage] = previous + self.smoothing * (seconds - previous)
+
+    def estimate_per_email(self):
+        """
+        Estimate the cost of processing one more email.
+
+        Returns:
+            Seconds (0 until the first email has been measured)
+        """
+        return sum(self.stage_estimates.values())
+
+    def remaining(self):
+        """
+        Seconds left before the deadline.
+
+        Returns:
+            Seconds (negative once the deadline has passed)
+        """
+        return self.deadline - time.monotonic()
+
+    def has_time_for_next(self):
+        """
+        Check whether one more email fits before the deadline.
+
+        Keeps reserve_seconds free for end-of-run work (saving state, summary).
+
+        Returns:
+            True if another email should be started
+        """
+        needed = self.estimate_per_email() * self.safety_factor + self.reserve_seconds
+        return self.remaining() >= needed
+
+
+def get_backlog_path():
+    """
+    Get the backlog file path.
+
+    Returns:
+        Path to the backlog JSON file
+    """
+    return os.getenv('BACKLOG_FILE', '.tmp/backlog.json')
+
+
+def load_backlog():
+    """
+    Load emails left over from earlier runs, dropping entries that are too old.
+
+    Returns:
+        List of email dictionaries ('id', 'threadId'), highest priority first
+    """
+    path = get_backlog_path()
+    if not os.path.exists(path):
+        return []
+
+    try:
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading backlog, starting empty: {e}")
+        return []
+
+    max_age_days = float(os.getenv('BACKLOG_MAX_AGE_DAYS', 7))
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat(timespec='seconds')
+    fresh = [entry for entry in entries if entry.get('enqueued_at', '') >= cutoff]
+
+    if len(fresh) < len(entries):
+        logger.info(f"Dropped {len(entries) - len(fresh)} backlog entries older than {max_age_days} days")
+    logger.info(f"Loaded {len(fresh)} backlog emails from previous runs")
+    return fresh
+
+
+def save_backlog(emails):
+    """
+    Persist emails that still need processing, in priority order.
+
+    Called after every email so a hard kill loses at most the email in flight.
+
+    Args:
+        emails: List of email dictionaries ('id', 'threadId', optional 'enqueued_at')
+    """
+    path = get_backlog_path()
+    now = datetime.now().isoformat(timespec='seconds')
+    entries = [
+        {
+            'id': email['id'],
+            'threadId': email.get('threadId'),
+            'enqueued_at': email.get('enqueued_at', now)
+        }
+        for email in emails
+    ]
+
+    try:
+        ensure_directory_exists(os.path.dirname(path) or '.')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error saving backlog: {e}")
+
+
+def get_processed_path():
+    """
+    Get the processed-IDs file path.
+
+    Returns:
+        Path to the processed-IDs JSON file
+    """
+    return os.getenv('PROCESSED_IDS_FILE', '.tmp/processed_ids.json')
+
+
+def load_processed_ids():
+    """
+    Load the IDs of emails earlier runs already decided, dropping old entries.
+
+    Emails classified NO keep matching the unprocessed query (they stay
+    unread and unlabeled), so without this record every run would classify
+    them again. Entries older than PROCESSED_IDS_MAX_AGE_DAYS (default 8,
+    just past the query's 7-day window) can no longer be fetched and are dropped.
+
+    Returns:
+        Dictionary of message ID -> ISO timestamp of the decision
+    """
+    path = get_processed_path()
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r') as f:
+            processed = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading processed IDs, starting empty: {e}")
+        return {}
+
+    max_age_days = float(os.getenv('PROCESSED_IDS_MAX_AGE_DAYS', 8))
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat(timespec='seconds')
+    fresh = {email_id: decided_at for email_id, decided_at in processed.items() if decided_at >= cutoff}
+
+    logger.info(f"Loaded {len(fresh)} already processed email IDs")
+    return fresh
+
+
+def save_processed_ids(processed):
+    """
+    Persist the IDs of decided emails.
+
+    Args:
+        processed: Dictionary of message ID -> ISO timestamp of the decision
+    """
+    path = get_processed_path()
+    try:
+        ensure_directory_exists(os.path.dirname(path) or '.')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(processed, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Error saving processed IDs: {e}")
+
+
+def merge_candidates(backlog, fetched, processed=()):
+    """
+    Combine backlog and newly fetched emails: backlog first, then newest-first fetch order.
+
+    Args:
+        backlog: Emails carried over from earlier runs
+        fetched: Emails from this run's Gmail query (newest first)
+        processed: IDs already decided by earlier runs, left out
+
+    Returns:
+        De-duplicated list of email dictionaries
+    """
+    seen = set(processed)
+    candidates = []
+    for email in backlog + fetched:
+        if email['id'] not in seen:
+            seen.add(email['id'])
+            candidates.append(email)
+    return candidates
+
+
+if __name__ == "__main__":
+    print("Testing Run Scheduler...")
+    print("-" * 50)
+
+    backlog = load_backlog()
+    print(f"Backlog emails waiting: {len(backlog)}")
+    print(f"Emails already processed: {len(load_processed_ids())}")
+    for email in backlog[:5]:
+        print(f"  {email['id']} (enqueued {email.get('enqueued_at', 'unknown')})")
@@ -0,0 +1,326 @@
+"""
+Sender Reputation Module
+Purpose: Learns per-sender and per-domain verdict history so known senders skip the AI call
+Author: AI Agent
+Last Updated: 2026-10-19
+"""
+
+import os
+import hmac
+import json
+import random
+import hashlib
+from datetime import datetime, timedelta
+from email.utils import parseaddr
+from dotenv import load_dotenv
+from utils import setup_logging, ensure_directory_exists, file_lock
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("sender_reputation")
+
+# Shared mail providers: many unrelated people send from these, so the
+# domain alone says nothing about the email
+FREEMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'outlook.com', 'hotmail.com', 'live.com',
+    'yahoo.com', 'icloud.com', 'me.com', 'aol.com', 'proton.me', 'protonmail.com'
+}
+
+# Loaded store, shared by every lookup in this process
+_store = None
+
+# Verdicts recorded since the store was loaded: (kind, key hash, verdict, timestamp),
+# replayed onto the file on save so concurrent workers do not overwrite each other
+_journal = []
+
+
+def get_reputation_config():
+    """
+    Read the sender reputation settings from the environment.
+
+    Returns:
+        Dictionary with reputation settings
+    """
+    return {
+        'enabled': os.getenv('SENDER_REPUTATION_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'file': os.getenv('SENDER_REPUTATION_FILE', '.tmp/sender_reputation.json'),
+        'min_count': int(os.getenv('SENDER_REPUTATION_MIN_COUNT', 5)),
+        'min_agreement': float(os.getenv('SENDER_REPUTATION_MIN_AGREEMENT', 0.95)),
+        'resample_rate': float(os.getenv('SENDER_REPUTATION_RESAMPLE_RATE', 0.05)),
+        'half_life': float(os.getenv('SENDER_REPUTATION_HALF_LIFE', 10)),
+        'max_age_days': int(os.getenv('SENDER_REPUTATION_MAX_AGE_DAYS', 180)),
+        'hash_key': os.getenv('SENDER_REPUTATION_HASH_KEY', '')
+    }
+
+
+def hash_sender_key(value, hash_key):
+    """
+    Hash an address or domain for storage.
+
+    The store is cached between CI runs, so it must not contain the mailbox
+    owner's correspondents in clear text. With a secret hash_key (HMAC),
+    addresses cannot be confirmed by hashing guesses either.
+
+    Args:
+        value: Email address or domain (lowercase)
+        hash_key: Secret key; empty gives a plain SHA-256 hash
+
+    Returns:
+        32-character hex digest
+    """
+    return hmac.new(hash_key.encode('utf-8'), value.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def get_decay(half_life):
+    """
+    Per-verdict decay factor for a half-life measured in verdicts.
+
+    Args:
+        half_life: Number of newer verdicts after which an old one counts half
+
+    Returns:
+        Factor applied to existing counts before each new verdict
+    """
+    return 0.5 ** (1 / half_life)
+
+
+def read_reputation_file(path, config):
+    """
+    Read a reputation store file, upgrading older formats.
+
+    Args:
+        path: Store file path
+        config: Reputation settings (get_reputation_config())
+
+    Returns:
+        Dictionary with 'senders' and 'domains' decayed verdict counts
+        (empty if the file does not exist or cannot be read)
+    """
+    if not os.path.exists(path):
+        return {'senders': {}, 'domains': {}}
+
+    try:
+        with open(path, 'r') as f:
+            store = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading reputation store, starting fresh: {e}")
+        return {'senders': {}, 'domains': {}}
+
+    # Stores written before keys were hashed still hold clear-text addresses
+    for entries in store.values():
+        for key in [key for key in entries if '@' in key or '.' in key]:
+            entries[hash_sender_key(key, config['hash_key'])] = entries.pop(key)
+    # Counts saved without decay (or with a longer half-life) are scaled
+    # down to the steady-state total, keeping their yes/no ratio
+    max_total = 1 / (1 - get_decay(config['half_life']))
+    for entries in store.values():
+        for entry in entries.values():
+            total = entry['yes'] + entry['no']
+            if total > max_total:
+                entry['yes'] *= max_total / total
+                entry['no'] *= max_total / total
+    return store
+
+
+def load_reputation_store():
+    """
+    Load the reputation store from disk (once per process).
+
+    Returns:
+        Dictionary with 'senders' and 'domains' decayed verdict counts
+    """
+    global _store
+    if _store is not None:
+        return _store
+
+    _store = read_reputation_file(get_reputation_config()['file'], get_reputation_config())
+    logger.info(
+        f"Loaded reputation for {len(_store['senders'])} senders "
+        f"and {len(_store['domains'])} domains"
+    )
+    return _store
+
+
+def apply_verdict(store, kind, key_hash, is_managebac, decay, seen_at):
+    """
+    Decay an entry's counts and add one verdict.
+
+    Args:
+        store: Reputation store dictionary
+        kind: 'senders' or 'domains'
+        key_hash: Hashed address or domain
+        is_managebac: Verdict
+        decay: Per-verdict decay factor
+        seen_at: ISO timestamp of the verdict
+    """
+    entry = store[kind].setdefault(key_hash, {'yes': 0, 'no': 0})
+    entry['yes'] = round(entry['yes'] * decay + (1 if is_managebac else 0), 4)
+    entry['no'] = round(entry['no'] * decay + (0 if is_managebac else 1), 4)
+    entry['last_seen'] = max(entry.get('last_seen', seen_at), seen_at)
+
+
+def save_reputation_store():
+    """
+    Merge this process's new verdicts into the store on disk.
+
+    The file is re-read under a lock and the verdicts recorded since it was
+    loaded are replayed on top, so several workers saving the same store
+    each keep their learning instead of the last one overwriting the rest.
+    Senders and domains not seen for SENDER_REPUTATION_MAX_AGE_DAYS are dropped.
+    """
+    global _store
+    if _store is None:
+        return
+
+    config = get_reputation_config()
+    path = config['file']
+    decay = get_decay(config['half_life'])
+
+    try:
+        with file_lock(path):
+            store = read_reputation_file(path, config)
+            for kind, key_hash, is_managebac, seen_at in _journal:
+                apply_verdict(store, kind, key_hash, is_managebac, decay, seen_at)
+
+            cutoff = (datetime.now() - timedelta(days=config['max_age_days'])).isoformat(timespec='seconds')
+            for kind, entries in store.items():
+                stale = [key for key, entry in entries.items() if entry.get('last_seen', cutoff) < cutoff]
+                for key in stale:
+                    del entries[key]
+                if stale:
+                    logger.info(f"Pruned {len(stale)} {kind} not seen for {config['max_age_days']} days")
+
+            ensure_directory_exists(os.path.dirname(path) or '.')
+            # Write to a temp file first so a killed run never leaves a corrupt store
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(store, f)
+            os.replace(tmp_path, path)
+
+        logger.info(f"Saved reputation store to {path} ({len(_journal)} new verdicts merged)")
+        _store = store
+        _journal.clear()
+    except Exception as e:
+        logger.error(f"Error saving reputation store: {e}")
+
+
+def get_sender_keys(sender):
+    """
+    Extract the reputation keys (address and domain) from a From header.
+
+    Args:
+        sender: Email sender, e.g. 'Ms Smith <smith@school.org>'
+
+    Returns:
+        Tuple (address, domain); domain is None for shared mail providers
+    """
+    address = parseaddr(sender)[1].lower()
+    if '@' not in address:
+        return None, None
+
+    domain = address.rsplit('@', 1)[1]
+    if domain in FREEMAIL_DOMAINS:
+        domain = None
+
+    return address, domain
+
+
+def lookup_reputation(sender):
+    """
+    Decide an email from sender history alone, if the history is consistent.
+
+    The exact address is checked before the domain. A small share of
+    decidable emails is deliberately re-sampled through the classifier so
+    that a sender whose mail changes stops being auto-decided; such emails
+    come back flagged with resample=True and must reach a learning tier.
+
+    Args:
+        sender: Email sender
+
+    Returns:
+        Dictionary with is_managebac, key, count (decayed), agreement and resample,
+        or None if the history is not conclusive
+    """
+    config = get_reputation_config()
+    if not config['enabled']:
+        return None
+
+    store = load_reputation_store()
+    address, domain = get_sender_keys(sender)
+
+    for kind, key in (('senders', address), ('domains', domain)):
+        if not key:
+            continue
+        entry = store[kind].get(hash_sender_key(key, config['hash_key']))
+        if entry is None:
+            continue
+
+        count = entry['yes'] + entry['no']
+        if count < config['min_count']:
+            continue
+
+        agreement = max(entry['yes'], entry['no']) / count
+        if agreement < config['min_agreement']:
+            continue
+
+        resample = random.random() < config['resample_rate']
+        if resample:
+            logger.info(f"Re-sampling known {kind[:-1]} {key} to check for drift")
+
+        return {
+            'is_managebac': entry['yes'] > entry['no'],
+            'key': key,
+            'count': count,
+            'agreement': agreement,
+            'resample': resample
+        }
+
+    return None
+
+
+def record_verdict(sender, is_managebac):
+    """
+    Add a classifier verdict to the sender and domain history.
+
+    Existing counts decay first (half-life SENDER_REPUTATION_HALF_LIFE
+    verdicts), so recent mail outweighs old history and a drifting sender
+    stops being auto-decided after a few disagreements, however long its history.
+
+    Args:
+        sender: Email sender
+        is_managebac: Verdict for the email
+    """
+    config = get_reputation_config()
+    if not config['enabled']:
+        return
+
+    store = load_reputation_store()
+    address, domain = get_sender_keys(sender)
+    decay = get_decay(config['half_life'])
+    now = datetime.now().isoformat(timespec='seconds')
+
+    for kind, key in (('senders', address), ('domains', domain)):
+        if not key:
+            continue
+        key_hash = hash_sender_key(key, config['hash_key'])
+        apply_verdict(store, kind, key_hash, is_managebac, decay, now)
+        _journal.append((kind, key_hash, is_managebac, now))
+
+
+if __name__ == "__main__":
+    print("Testing Sender Reputation...")
+    print("-" * 50)
+
+    store = load_reputation_store()
+    print(f"Senders: {len(store['senders'])}, domains: {len(store['domains'])}")
+
+    # Show how many senders are currently auto-decided (keys are hashed)
+    config = get_reputation_config()
+    for kind in ('senders', 'domains'):
+        for key, entry in store[kind].items():
+            count = entry['yes'] + entry['no']
+            if count >= config['min_count'] and max(entry['yes'], entry['no']) / count >= config['min_agreement']:
+                verdict = '✅ ManageBac' if entry['yes'] > entry['no'] else '❌ Not ManageBac'
+                print(f"  {kind[:-1]} {key[:12]}…: {verdict} ({count:.1f} decayed emails)")
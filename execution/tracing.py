@@ -0,0 +1,216 @@
+"""
+Tracing Module
+Purpose: Lightweight per-email trace spans exported as OpenTelemetry (OTLP JSON) lines
+Author: AI Agent
+Last Updated: 2026-10-19
+
+Off by default (TRACING_ENABLED=false); when off, span() returns a shared
+no-op object and costs one boolean check.
+
+Each finished trace is appended to TRACES_FILE as one OTLP/JSON
+ExportTraceServiceRequest per line, which OpenTelemetry collectors (file
+receiver) and most trace viewers can ingest directly.
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# OTLP span kinds and status codes
+SPAN_KIND = {'internal': 1, 'server': 2, 'client': 3}
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Span that is active in the current thread/context
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class _NoopSpan:
+    """Stand-in returned by span() when tracing is off."""
+
+    recording = False
+    trace_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def to_otlp_value(value):
+    """
+    Convert a Python value to an OTLP AnyValue.
+
+    Args:
+        value: Attribute value
+
+    Returns:
+        OTLP AnyValue dictionary
+    """
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Use through span(); entering makes it the parent of spans opened inside
+    it, and leaving the root span of a trace exports the whole trace.
+    """
+
+    recording = True
+
+    def __init__(self, tracer, name, kind, attributes):
+        parent = _current_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.kind = SPAN_KIND[kind]
+        self.attributes = dict(attributes)
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.status = {'code': STATUS_OK}
+        self.start_ns = None
+        self.end_ns = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        """
+        Attach an attribute (status, retries, bytes, ...) to the span.
+
+        Args:
+            key: Attribute name
+            value: str, int, float or bool value
+        """
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.status = {'code': STATUS_ERROR, 'message': str(exc)[:500]}
+            self.attributes['exception.type'] = exc_type.__name__
+        self.tracer.finish(self)
+        return False
+
+    def to_otlp(self):
+        """
+        Convert to an OTLP/JSON span.
+
+        Returns:
+            Span dictionary
+        """
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': k, 'value': to_otlp_value(v)} for k, v in self.attributes.items()],
+            'status': self.status
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class FileTracer:
+    """
+    Collects finished spans per trace and appends each completed trace to a file.
+    """
+
+    def __init__(self, path, service_name='managebac-classifier'):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.service_name = service_name
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def finish(self, span):
+        """
+        Record a finished span; export the trace once its root span ends.
+
+        Args:
+            span: Finished Span
+        """
+        with self.lock:
+            spans = self.pending.setdefault(span.trace_id, [])
+            spans.append(span.to_otlp())
+            if span.parent_id is None:
+                del self.pending[span.trace_id]
+                self.export(spans)
+
+    def export(self, spans):
+        """
+        Append one OTLP/JSON ExportTraceServiceRequest line.
+
+        Args:
+            spans: OTLP span dictionaries of one trace
+        """
+        request = {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]
+                },
+                'scopeSpans': [{
+                    'scope': {'name': 'execution.tracing'},
+                    'spans': spans
+                }]
+            }]
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(request) + '\n')
+
+
+# Tracer for this process, or None when tracing is off
+_tracer = None
+if os.getenv('TRACING_ENABLED', 'false').lower() in ('1', 'true', 'yes'):
+    _tracer = FileTracer(os.getenv('TRACES_FILE', '.tmp/traces.jsonl'))
+
+
+def span(name, kind='internal', **attributes):
+    """
+    Open a span around an operation.
+
+    Example:
+        with span('gmail.messages.get', kind='client', email_id=email_id) as s:
+            response = request.execute()
+            s.set_attribute('http.response_bytes', len(body))
+
+    Args:
+        name: Operation name
+        kind: 'internal', 'server' or 'client' (outbound API call)
+        **attributes: Initial span attributes
+
+    Returns:
+        Context manager yielding the span (a no-op when tracing is off)
+    """
+    if _tracer is None:
+        return NOOP_SPAN
+    return Span(_tracer, name, kind, attributes)
+
@@ -7,9 +7,16 @@ Last Updated: 2025-12-11
 
 import os
 import logging
+import random
+import threading
+import functools
+import contextlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 from typing import Any, Optional
 import time
+from tracing import span
 
 # Load environment variables
 load_dotenv()
@@ -83,6 +90,304 @@ def get_env_var(key: str, required: bool = True) -> Optional[str]:
     return value
 
 
+# HTTP statuses worth retrying: timeouts, rate limits and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Gmail reports quota exhaustion as 403 with one of these reasons
+RETRYABLE_403_REASONS = ('ratelimitexceeded', 'userratelimitexceeded', 'quotaexceeded')
+
+# Transport errors without a status code (Groq SDK, httplib2, google-auth)
+RETRYABLE_ERROR_NAMES = {
+    'APIConnectionError', 'APITimeoutError', 'HttpLib2Error', 'ServerNotFoundError', 'TransportError'
+}
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """
+    Get the HTTP status code from a Gmail, Groq or requests error.
+    
+    Args:
+        error: Raised exception
+        
+    Returns:
+        Status code, or None if the error carries no HTTP response
+    """
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Read a server Retry-After hint (seconds or HTTP date) from an error.
+    
+    Args:
+        error: Raised exception
+        
+    Returns:
+        Seconds to wait, or None if the server gave no hint
+    """
+    headers = getattr(error, 'resp', None)
+    if headers is None:
+        headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers is None or not hasattr(headers, 'get'):
+        return None
+    
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    if not value:
+        return None
+    
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Decide whether an error is transient (retry) or fatal (give up now).
+    
+    Args:
+        error: Raised exception
+        
+    Returns:
+        True if retrying may succeed
+    """
+    status = get_status_code(error)
+    if status is not None:
+        if status in RETRYABLE_STATUS_CODES:
+            return True
+        if status == 403:
+            content = getattr(error, 'content', b'') or b''
+            if isinstance(content, bytes):
+                content = content.decode('utf-8', errors='ignore')
+            details = f"{error} {content}".lower().replace(' ', '')
+            return any(reason in details for reason in RETRYABLE_403_REASONS)
+        return False
+    
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class RetryBudget:
+    """
+    Retry allowance shared by every policy in a process, refilled over time.
+    
+    Works as a token bucket: up to max_retries can be spent in a burst, and
+    spent retries come back at refill_per_minute. When it is empty, failures
+    are raised immediately instead of sleeping, so a broken upstream cannot
+    turn a run into a long series of backoffs. Refill is off by default, which
+    makes max_retries a hard per-run limit; long-lived processes (workers,
+    reclassify jobs) turn it on with set_refill() so they recover after an outage.
+    
+    A deadline (time.monotonic() value) can be set as well; no retry sleep
+    may end past it, so a budgeted run never backs off into its job timeout.
+    """
+    
+    def __init__(self, max_retries: int, refill_per_minute: float = 0.0):
+        self.capacity = max_retries
+        self.remaining = float(max_retries)
+        self.refill_per_second = refill_per_minute / 60
+        self.updated = time.monotonic()
+        self.deadline = None
+        self.lock = threading.Lock()
+    
+    def set_refill(self, refill_per_minute: float):
+        """
+        Change how fast spent retries come back.
+        
+        Args:
+            refill_per_minute: Retries returned per minute (0 = never)
+        """
+        with self.lock:
+            self.refill_per_second = refill_per_minute / 60
+            self.updated = time.monotonic()
+    
+    def set_deadline(self, deadline: Optional[float]):
+        """
+        Forbid retry sleeps that would end after a time.monotonic() deadline.
+        
+        Args:
+            deadline: Monotonic timestamp, or None for no deadline
+        """
+        self.deadline = deadline
+    
+    def fits_before_deadline(self, delay: float) -> bool:
+        """
+        Check whether sleeping for delay seconds stays within the deadline.
+        
+        Args:
+            delay: Planned sleep in seconds
+            
+        Returns:
+            True if there is no deadline or the sleep ends before it
+        """
+        return self.deadline is None or time.monotonic() + delay < self.deadline
+    
+    def consume(self) -> bool:
+        """
+        Take one retry from the budget.
+        
+        Returns:
+            True if a retry was available
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.remaining = min(self.capacity, self.remaining + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+            if self.remaining < 1:
+                return False
+            self.remaining -= 1
+            return True
+
+
+# Budget shared by all API calls in this process (one process = one run).
+# Long-running entry points enable refill with RUN_RETRY_BUDGET.set_refill()
+RUN_RETRY_BUDGET = RetryBudget(int(os.getenv('RETRY_BUDGET_PER_RUN', 30)))
+
+
+def get_retry_refill_rate() -> float:
+    """
+    Refill rate for long-running processes (distributed workers, reclassify).
+    
+    Returns:
+        Retries returned per minute (RETRY_BUDGET_REFILL_PER_MINUTE, default 6)
+    """
+    return float(os.getenv('RETRY_BUDGET_REFILL_PER_MINUTE', 6))
+
+
+class RetryPolicy:
+    """
+    Retry policy for outbound API calls.
+    
+    - Only retryable errors (429, 5xx, timeouts, connection errors) are retried
+    - A server Retry-After hint is honoured (up to max_retry_after)
+    - Otherwise delays use full jitter: uniform(0, min(max_delay, initial * base^attempt))
+    - Every retry spends from a shared budget, and never sleeps past its deadline
+    
+    Usable as a decorator or via call():
+        @gmail_retry
+        def execute(request): ...
+        
+        policy.call(func, *args)
+    """
+    
+    def __init__(
+        self,
+        name: str = "retry",
+        max_attempts: int = 3,
+        initial_delay: float = 1.0,
+        max_delay: float = 60.0,
+        exponential_base: float = 2.0,
+        max_retry_after: float = 120.0,
+        budget: Optional[RetryBudget] = None
+    ):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.exponential_base = exponential_base
+        self.max_retry_after = max_retry_after
+        self.budget = budget or RUN_RETRY_BUDGET
+        self.logger = setup_logging("retry")
+    
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+    
+    def get_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        Work out how long to wait before the next attempt.
+        
+        Args:
+            attempt: Zero-based index of the attempt that failed
+            error: The error it failed with
+            
+        Returns:
+            Seconds to sleep, or None if the server asks for longer than max_retry_after
+        """
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            # Small jitter on top so workers told the same time do not wake together
+            return retry_after + random.uniform(0, self.initial_delay)
+        
+        cap = min(self.initial_delay * (self.exponential_base ** attempt), self.max_delay)
+        return random.uniform(0, cap)
+    
+    def call(self, func, *args, **kwargs):
+        """
+        Call a function, retrying transient failures.
+        
+        Args:
+            func: Function to call
+            *args, **kwargs: Arguments for func
+            
+        Returns:
+            Result of the function call
+            
+        Raises:
+            The error itself if it is fatal, or the last error once attempts,
+            Retry-After limit or run budget are exhausted
+        """
+        # One span covers all attempts, so retry sleeps show up as its own time
+        with span(self.name, kind='client') as retry_span:
+            sleep_seconds = 0.0
+            for attempt in range(self.max_attempts):
+                retry_span.set_attribute('retries', attempt)
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    status = get_status_code(e)
+                    if status is not None:
+                        retry_span.set_attribute('http.status_code', status)
+                    
+                    if not is_retryable_error(e):
+                        self.logger.error(f"[{self.name}] Non-retryable error: {e}")
+                        raise
+                    
+                    if attempt == self.max_attempts - 1:
+                        self.logger.error(f"[{self.name}] All {self.max_attempts} attempts failed. Last error: {e}")
+                        raise
+                    
+                    delay = self.get_delay(attempt, e)
+                    if delay is None:
+                        self.logger.error(f"[{self.name}] Server asked to wait longer than {self.max_retry_after}s: {e}")
+                        raise
+                    
+                    if not self.budget.fits_before_deadline(delay):
+                        self.logger.error(f"[{self.name}] Retry in {delay:.0f}s would pass the run deadline: {e}")
+                        raise
+                    
+                    if not self.budget.consume():
+                        self.logger.error(f"[{self.name}] Retry budget exhausted: {e}")
+                        raise
+                    
+                    self.logger.warning(
+                        f"[{self.name}] Attempt {attempt + 1} failed: {e}. Retrying in {delay:.2f}s..."
+                    )
+                    sleep_seconds += delay
+                    retry_span.set_attribute('retry.sleep_seconds', sleep_seconds)
+                    time.sleep(delay)
+
+
 def retry_with_exponential_backoff(
     func,
     max_attempts: int = 3,
@@ -93,6 +398,9 @@ def retry_with_exponential_backoff(
     """
     Retry a function with exponential backoff.
     
+    Thin wrapper around RetryPolicy kept for existing callers: fatal errors
+    are not retried, Retry-After is honoured and delays are jittered.
+    
     Args:
         func: Function to retry
         max_attempts: Maximum number of retry attempts
@@ -106,19 +414,13 @@ def retry_with_exponential_backoff(
     Raises:
         Last exception if all attempts fail
     """
-    logger = setup_logging("retry")
-    
-    for attempt in range(max_attempts):
-        try:
-            return func()
-        except Exception as e:
-            if attempt == max_attempts - 1:
-                logger.error(f"All {max_attempts} attempts failed. Last error: {e}")
-                raise
-            
-            delay = min(initial_delay * (exponential_base ** attempt), max_delay)
-            logger.warning(f"Attempt {attempt + 1} failed: {e}. Retrying in {delay:.2f}s...")
-            time.sleep(delay)
+    policy = RetryPolicy(
+        max_attempts=max_attempts,
+        initial_delay=initial_delay,
+        max_delay=max_delay,
+        exponential_base=exponential_base
+    )
+    return policy.call(func)
 
 
 def ensure_directory_exists(directory: str) -> None:
@@ -131,6 +433,32 @@ def ensure_directory_exists(directory: str) -> None:
     os.makedirs(directory, exist_ok=True)
 
 
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on '<path>.lock' across processes on this machine.
+    
+    Used around read-merge-write of state files that several worker
+    processes save. On platforms without fcntl (Windows) no lock is taken.
+    
+    Args:
+        path: Path of the file being protected
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    
+    ensure_directory_exists(os.path.dirname(path) or '.')
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def safe_get(data: dict, *keys: str, default: Any = None) -> Any:
     """
     Safely get nested dictionary values.
@@ -174,9 +502,8 @@ if __name__ == "__main__":
     
     # Test retry
     def test_function():
-        import random
         if random.random() < 0.7:  # 70% chance of failure
-            raise Exception("Random failure")
+            raise ConnectionError("Random failure")
         return "Success!"
     
     try:
@@ -0,0 +1,234 @@
+"""
+Work Queue Module
+Purpose: Durable message-ID queue with leasing, visibility timeouts and retries for worker processes
+Author: AI Agent
+Last Updated: 2026-10-19
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+from utils import setup_logging, ensure_directory_exists
+
+# Load environment variables
+load_dotenv()
+
+# Setup logging
+logger = setup_logging("work_queue")
+
+
+class WorkQueue(ABC):
+    """
+    Interface every queue backend implements (a backend missing a method
+    cannot be instantiated).
+
+    Items are email dictionaries keyed by message ID. A worker leases items
+    for visibility_timeout seconds; if it neither acks nor nacks in time
+    (crash, kill), the lease expires and another worker picks the item up.
+    """
+
+    @abstractmethod
+    def enqueue(self, items):
+        """
+        Add items; IDs already in the queue (in any state) are ignored.
+
+        Args:
+            items: List of dictionaries with 'id' (and optionally 'threadId')
+
+        Returns:
+            Number of newly added items
+        """
+
+    @abstractmethod
+    def lease(self, worker_id, count, visibility_timeout):
+        """
+        Lease up to count available items.
+
+        Args:
+            worker_id: Identifier of the leasing worker
+            count: Maximum number of items
+            visibility_timeout: Seconds before an un-acked lease expires
+
+        Returns:
+            List of item dictionaries with 'id', 'threadId', 'lease_token', 'attempts'
+        """
+
+    @abstractmethod
+    def ack(self, item_id, lease_token):
+        """
+        Mark a leased item done.
+
+        Args:
+            item_id: Message ID
+            lease_token: Token from lease(); stale tokens are ignored
+
+        Returns:
+            True if the lease was still held
+        """
+
+    @abstractmethod
+    def nack(self, item_id, lease_token, error, retry_delay):
+        """
+        Release a leased item after a failure, or dead-letter it once out of attempts.
+
+        Args:
+            item_id: Message ID
+            lease_token: Token from lease()
+            error: Error description
+            retry_delay: Seconds before the item becomes available again
+
+        Returns:
+            True if the lease was still held
+        """
+
+    @abstractmethod
+    def stats(self):
+        """
+        Count items by status.
+
+        Returns:
+            Dictionary of status -> count
+        """
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    WorkQueue backed by a single SQLite file.
+
+    Leasing runs inside BEGIN IMMEDIATE, so concurrent workers on the same
+    machine never lease the same item. For workers on several machines,
+    point them at a backend with a network server (see QUEUE_BACKENDS);
+    SQLite locking over network filesystems is not reliable.
+    """
+
+    def __init__(self, path, max_attempts=5):
+        ensure_directory_exists(os.path.dirname(path) or '.')
+        self.max_attempts = max_attempts
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'id TEXT PRIMARY KEY, '
+            'payload TEXT NOT NULL, '
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'lease_owner TEXT, '
+            'lease_token TEXT, '
+            'lease_expires REAL, '
+            'available_at REAL NOT NULL, '
+            'enqueued_at REAL NOT NULL, '
+            'updated_at REAL NOT NULL, '
+            'last_error TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_items_status ON items (status, available_at)')
+
+    def enqueue(self, items):
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            added = 0
+            for item in items:
+                payload = json.dumps({'id': item['id'], 'threadId': item.get('threadId')})
+                added += self.conn.execute(
+                    'INSERT OR IGNORE INTO items (id, payload, available_at, enqueued_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (item['id'], payload, now, now, now)
+                ).rowcount
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return added
+
+    def lease(self, worker_id, count, visibility_timeout):
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Expired leases that used their last attempt are dead-lettered, not re-leased
+            self.conn.execute(
+                "UPDATE items SET status = 'dead', last_error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            rows = self.conn.execute(
+                "SELECT id, payload, attempts FROM items "
+                "WHERE (status = 'pending' AND available_at <= ?) "
+                "OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY enqueued_at, id LIMIT ?",
+                (now, now, count)
+            ).fetchall()
+
+            leased = []
+            for item_id, payload, attempts in rows:
+                token = uuid.uuid4().hex
+                self.conn.execute(
+                    "UPDATE items SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                    "lease_token = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, token, now + visibility_timeout, now, item_id)
+                )
+                item = json.loads(payload)
+                item.update({'lease_token': token, 'attempts': attempts + 1})
+                leased.append(item)
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return leased
+
+    def ack(self, item_id, lease_token):
+        return self.conn.execute(
+            "UPDATE items SET status = 'done', lease_token = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (time.time(), item_id, lease_token)
+        ).rowcount == 1
+
+    def nack(self, item_id, lease_token, error, retry_delay):
+        now = time.time()
+        return self.conn.execute(
+            "UPDATE items SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, "
+            "lease_token = NULL, available_at = ?, last_error = ?, updated_at = ? "
+            "WHERE id = ? AND lease_token = ? AND status = 'leased'",
+            (self.max_attempts, now + retry_delay, str(error)[:500], now, item_id, lease_token)
+        ).rowcount == 1
+
+    def stats(self):
+        rows = self.conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+
+# Available backends; another backend (e.g. a network queue shared by
+# several machines) only needs to implement WorkQueue and be registered here
+QUEUE_BACKENDS = {
+    'sqlite': lambda: SQLiteWorkQueue(
+        os.getenv('WORK_QUEUE_FILE', '.tmp/work_queue.sqlite3'),
+        max_attempts=int(os.getenv('WORK_QUEUE_MAX_ATTEMPTS', 5))
+    )
+}
+
+
+def open_work_queue():
+    """
+    Open the queue backend selected by WORK_QUEUE_BACKEND.
+
+    Returns:
+        WorkQueue instance
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    backend = os.getenv('WORK_QUEUE_BACKEND', 'sqlite')
+    if backend not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown WORK_QUEUE_BACKEND '{backend}' (available: {', '.join(QUEUE_BACKENDS)})")
+    return QUEUE_BACKENDS[backend]()
+
+
+if __name__ == "__main__":
+    print("Testing Work Queue...")
+    print("-" * 50)
+
+    queue = open_work_queue()
+    print(f"Queue status: {queue.stats() or 'empty'}")